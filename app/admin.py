@@ -2,6 +2,12 @@ from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.filters import CommandStart, Command, Filter
 
+from app import audio_cache, breaker, metrics, sessions
+from app.artwork import reload_default
+from app.database.batcher import writes
+from app.scheduler import downloads
+from app.settings import THUMB_PATH
+
 admin = Router()
 
 class Admin(Filter):
@@ -14,10 +20,35 @@ async def get_photo(message: Message):
     file_id =  message.photo[-1].file_id
     file = await message.bot.get_file(file_id)
 
-    file_path = f"tttumb.jpg"
+    file_path = THUMB_PATH
     await message.bot.download_file(file.file_path, destination=file_path)
+    reload_default()
+
+    await message.answer(f"✔️ Thumbnail сохранён как {file_path}")
+
+
+def _fmt(stats):
+    if not isinstance(stats, dict):
+        return str(stats)
+    return ", ".join(
+        f"{k}={v:.2f}" if isinstance(v, float) else f"{k}={v}" for k, v in stats.items()
+    )
+
+
+@admin.message(Admin(), Command("stats"))
+async def cmd_stats(message: Message):
+    lines = [metrics.summary() or "Метрик пока нет"]
+
+    for name, stats in (await sessions.stats()).items():
+        lines.append(f"sessions {name}: {_fmt(stats)}")
+    for source, stats in downloads.stats().items():
+        lines.append(f"downloads {source}: {_fmt(stats)}")
+    lines.append(f"db writes: {_fmt(writes.stats())}")
+    lines.append(f"audio cache: {_fmt(await audio_cache.stats())}")
+    for name, stats in breaker.stats().items():
+        lines.append(f"provider {name}: {_fmt(stats)}")
 
-    await message.answer("✔️ Thumbnail сохранён как tttumb.jpg")
+    await message.answer("\n".join(lines)[:4000])
 
 
 @admin.message(Admin(), F.sticker)
@@ -0,0 +1,208 @@
+"""
+Обложки для отправляемого аудио.
+- Общая обложка (THUMB_PATH) читается с диска один раз и перечитывается,
+  когда админ присылает новую (reload_default).
+- Обложка трека (track["thumb"]) скачивается, ужимается под лимиты Telegram
+  (JPEG, до 320x320, до 200 КБ) и кэшируется в памяти и на диске по URL.
+Если обложку трека получить не удалось — отдаём общую.
+"""
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import tempfile
+
+from aiogram.types import BufferedInputFile
+
+from app import http, metrics
+from app.cache import TTLCache
+from app.download import remove_file
+from app.settings import (
+    THUMB_PATH, ARTWORK_ENABLED, ARTWORK_DIR, ARTWORK_DISK_BYTES, ARTWORK_MEMORY_BYTES,
+    ARTWORK_TIMEOUT
+)
+
+try:
+    from PIL import Image
+except ImportError:   # Pillow необязателен: без него берём только JPEG не больше 320x320 и 200 КБ
+    Image = None
+
+THUMB_MAX_SIDE = 320
+THUMB_MAX_BYTES = 200 * 1024
+LEGACY_THUMB_PATH = "ttumb.jpg"
+
+_default = None
+_memory = TTLCache(max_bytes=ARTWORK_MEMORY_BYTES, ttl=24 * 3600, sizeof=len)
+_failed = TTLCache(max_entries=10_000, ttl=3600)   # URL, которые не удалось получить
+_disk = None
+
+metrics.register_cache("artwork", _memory)
+
+logger = logging.getLogger(__name__)
+
+
+# --- Общая обложка ---
+
+def reload_default():
+    """Перечитывает общую обложку с диска (после загрузки админом)."""
+    global _default
+    _default = None
+    for path in (THUMB_PATH, LEGACY_THUMB_PATH):
+        try:
+            with open(path, "rb") as f:
+                _default = f.read()
+            break
+        except OSError:
+            continue
+
+    if _default is None:
+        logger.error("Нет общей обложки %s", THUMB_PATH)
+    return _default
+
+
+def default_thumb():
+    """Общая обложка как BufferedInputFile (или None, если файла нет)."""
+    data = _default if _default is not None else reload_default()
+    if not data:
+        return None
+    return BufferedInputFile(data, filename="thumb.jpg")
+
+
+# --- Обложка трека ---
+
+def _disk_cache():
+    """Дисковый кэш: при первом обращении подхватываем файлы прошлых запусков (старые — первыми)."""
+    global _disk
+    if _disk is None:
+        _disk = TTLCache(
+            max_entries=100_000,
+            max_bytes=ARTWORK_DISK_BYTES,
+            ttl=30 * 24 * 3600,
+            sizeof=os.path.getsize,
+            on_evict=lambda key, path: remove_file(path),
+        )
+        os.makedirs(ARTWORK_DIR, exist_ok=True)
+        entries = [
+            os.path.join(ARTWORK_DIR, name) for name in os.listdir(ARTWORK_DIR)
+            if name.endswith(".jpg")
+        ]
+        for path in sorted(entries, key=os.path.getmtime):
+            _disk.set(os.path.basename(path), path)
+    return _disk
+
+
+def _artwork_url(track):
+    url = track.get("thumb")
+    if url and track.get("source") == "SoundCloud":
+        # у SoundCloud есть готовый размер 300x300 — он уже влезает в лимит
+        url = url.replace("t500x500", "t300x300")
+    return url
+
+
+def _jpeg_size(data):
+    """(ширина, высота) JPEG из заголовка кадра SOF или None — без Pillow."""
+    if data[:2] != b"\xff\xd8":
+        return None
+    i = 2
+    while i + 9 <= len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:   # заполнитель перед маркером
+            i += 1
+            continue
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height = int.from_bytes(data[i + 5:i + 7], "big")
+            width = int.from_bytes(data[i + 7:i + 9], "big")
+            return width, height
+        i += 2 + int.from_bytes(data[i + 2:i + 4], "big")
+    return None
+
+
+def _fit(data):
+    """Приводит картинку к лимитам Telegram; None, если не получилось."""
+    if Image is None:
+        # ужать нечем: берём только JPEG, который уже влезает в лимиты и по весу, и по размеру
+        size = _jpeg_size(data)
+        if size and max(size) <= THUMB_MAX_SIDE and len(data) <= THUMB_MAX_BYTES:
+            return data
+        return None
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        image = image.convert("RGB")
+        image.thumbnail((THUMB_MAX_SIDE, THUMB_MAX_SIDE))
+
+        for quality in (90, 80, 70, 60):
+            out = io.BytesIO()
+            image.save(out, format="JPEG", quality=quality)
+            if out.tell() <= THUMB_MAX_BYTES:
+                return out.getvalue()
+    except Exception as e:
+        logger.warning("Не удалось ужать обложку: %s", e)
+    return None
+
+
+async def _fetch(url):
+    try:
+        async with http.get(url, timeout=ARTWORK_TIMEOUT) as resp:
+            if resp.status != 200:
+                return None
+            data = await resp.read()
+    except Exception as e:
+        logger.warning("Обложка не скачалась: %s", e)
+        return None
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, _fit, data)
+
+
+async def track_artwork(url):
+    """Готовая (ужатая) обложка по URL: память -> диск -> сеть."""
+    data = _memory.get(url)
+    if data is not None:
+        return data
+
+    disk = _disk_cache()
+    name = hashlib.sha1(url.encode()).hexdigest() + ".jpg"
+    path = disk.get(name)
+    if path is not None:
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            disk.pop(name, notify=False)
+            data = None
+
+    if data is None:
+        if url in _failed:
+            return None
+        data = await _fetch(url)
+        if data is None:
+            _failed.set(url, True)
+            return None
+
+        # тот же URL мог параллельно скачать другой запрос: у каждого свой .tmp,
+        # а старую запись снимаем без on_evict, иначе он удалит только что записанный файл
+        path = os.path.join(ARTWORK_DIR, name)
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=ARTWORK_DIR)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        disk.pop(name, notify=False)
+        disk.set(name, path)
+
+    _memory.set(url, data)
+    return data
+
+
+async def get_thumbnail(track):
+    """Обложка для send_audio: своя у трека, иначе общая."""
+    url = _artwork_url(track) if ARTWORK_ENABLED else None
+    if url:
+        data = await track_artwork(url)
+        if data:
+            return BufferedInputFile(data, filename="thumb.jpg")
+
+    return default_thumb()
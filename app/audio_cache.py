@@ -0,0 +1,246 @@
+"""
+Локальный кэш mp3 на диске: повторная отправка трека (протух file_id, другой токен бота,
+чат и inline загружают отдельно) обходится без скачивания у источника.
+- Файл лежит под sha256 содержимого: AUDIO_CACHE_DIR/ab/ab12....mp3 — один и тот же mp3,
+  пришедший под разными ключами, хранится один раз.
+- Индекс (ключ трека -> хэш, размер, последнее использование) — таблица audio_files в общей базе.
+- Файл пишется во временный и переименовывается: недописанный файл в кэш не попадает.
+- Сверх AUDIO_CACHE_BYTES вытесняются давно не использованные файлы (LRU).
+  Файл, который отправляет этот процесс, не вытесняется никогда; файлы, взятые
+  за последние EVICT_GRACE секунд (last_used в общем индексе), не вытесняет ни один
+  процесс — так соседний воркер не удалит файл посреди чужой отправки.
+  Поэтому кэш может ненадолго превысить бюджет.
+
+    async with audio_cache.use(keys) as path:
+        if path:
+            await bot.send_audio(chat_id, FSInputFile(path))
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.sqlite import insert
+
+from app import metrics
+from app.download import remove_file
+from app.database.models import AudioFile, async_session
+from app.settings import AUDIO_CACHE_DIR, AUDIO_CACHE_BYTES
+
+logger = logging.getLogger(__name__)
+
+COPY_CHUNK = 1024 * 1024
+STALE_FILE_AGE = 3600  # сек; более свежие файлы без записи может дописывать соседний процесс
+EVICT_GRACE = 600      # сек; дольше отправка одного файла не длится
+
+_pinned = Counter()    # digest -> сколько отправок этого процесса сейчас читают файл
+
+
+def _path(digest):
+    return os.path.join(AUDIO_CACHE_DIR, digest[:2], digest + ".mp3")
+
+
+@contextmanager
+def _pin(digest):
+    _pinned[digest] += 1
+    try:
+        yield
+    finally:
+        _pinned[digest] -= 1
+        if not _pinned[digest]:
+            del _pinned[digest]
+
+
+def _copy(source):
+    """Копирует source в кэш под хэшем содержимого; (digest, size). Блокирует — только в потоке."""
+    os.makedirs(AUDIO_CACHE_DIR, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=AUDIO_CACHE_DIR)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(source, "rb") as src, os.fdopen(fd, "wb") as dst:
+            while chunk := src.read(COPY_CHUNK):
+                digest.update(chunk)
+                dst.write(chunk)
+                size += len(chunk)
+
+        digest = digest.hexdigest()
+        target = _path(digest)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # тот же файл мог уже лежать в кэше — содержимое одинаковое, замена безопасна
+        os.replace(tmp, target)
+    except BaseException:
+        remove_file(tmp)
+        raise
+    return digest, size
+
+
+async def _lookup(keys):
+    async with async_session() as session:
+        return await session.scalar(
+            select(AudioFile.digest).where(AudioFile.track_key.in_(keys)).limit(1)
+        )
+
+
+async def _touch(digest):
+    async with async_session() as session:
+        await session.execute(
+            update(AudioFile).where(AudioFile.digest == digest).values(last_used=time.time())
+        )
+        await session.commit()
+
+
+async def _forget(digests):
+    async with async_session() as session:
+        await session.execute(delete(AudioFile).where(AudioFile.digest.in_(digests)))
+        await session.commit()
+
+
+async def _index(keys, digest, size):
+    statement = insert(AudioFile).values([
+        {"track_key": key, "digest": digest, "size": size, "last_used": time.time()} for key in keys
+    ])
+    statement = statement.on_conflict_do_update(
+        index_elements=[AudioFile.track_key],
+        set_={
+            "digest": statement.excluded.digest,
+            "size": statement.excluded.size,
+            "last_used": statement.excluded.last_used,
+        },
+    )
+    async with async_session() as session:
+        await session.execute(statement)
+        await session.commit()
+
+
+def _files():
+    # один файл на хэш, сколько бы ключей на него ни ссылалось
+    return (
+        select(
+            AudioFile.digest,
+            func.max(AudioFile.size).label("size"),
+            func.max(AudioFile.last_used).label("last_used"),
+        )
+        .group_by(AudioFile.digest)
+        .subquery()
+    )
+
+
+async def _evict():
+    """Удаляет давно не использованные файлы, пока кэш не влезет в AUDIO_CACHE_BYTES."""
+    files = _files()
+    async with async_session() as session:
+        total = await session.scalar(select(func.coalesce(func.sum(files.c.size), 0)))
+        if total <= AUDIO_CACHE_BYTES:
+            return
+        rows = (await session.execute(
+            select(files.c.digest, files.c.size)
+            .where(files.c.last_used < time.time() - EVICT_GRACE)
+            .order_by(files.c.last_used)
+        )).all()
+
+    victims = []
+    for digest, size in rows:
+        if total <= AUDIO_CACHE_BYTES:
+            break
+        if _pinned[digest]:
+            continue
+        victims.append(digest)
+        total -= size
+
+    if not victims:
+        return
+    # сначала запись, потом файл: по записи без файла use() просто промахнётся
+    await _forget(victims)
+    for digest in victims:
+        remove_file(_path(digest))
+    metrics.inc("audio_cache_evicted_total", len(victims))
+
+
+async def contains(keys):
+    """Есть ли в кэше файл под любым из ключей keys (без учёта в hit/miss)."""
+    return await _lookup(keys) is not None
+
+
+@asynccontextmanager
+async def use(keys):
+    """
+    Путь к файлу из кэша по любому из ключей keys или None.
+    Пока контекст открыт, файл не вытесняется.
+    """
+    digest = await _lookup(keys)
+    if digest is None:
+        metrics.inc("audio_cache_total", result="miss")
+        yield None
+        return
+
+    with _pin(digest):
+        path = _path(digest)
+        if not os.path.exists(path):
+            # файл удалили вручную или вытеснил другой процесс
+            await _forget([digest])
+            metrics.inc("audio_cache_total", result="miss")
+            yield None
+            return
+
+        await _touch(digest)
+        metrics.inc("audio_cache_total", result="hit")
+        yield path
+
+
+@asynccontextmanager
+async def store(keys, path):
+    """
+    Кладёт скачанный файл path в кэш под ключами keys и отдаёт путь к копии в кэше
+    (None, если положить не удалось). Пока контекст открыт, копия не вытесняется.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        digest, size = await loop.run_in_executor(None, _copy, path)
+    except OSError as e:
+        logger.warning("Не удалось положить mp3 в кэш: %s", e)
+        yield None
+        return
+
+    with _pin(digest):
+        try:
+            await _index(keys, digest, size)
+            await _evict()
+        except Exception as e:
+            # файл без записи в индексе уберёт cleanup() при следующем запуске
+            logger.warning("Не удалось обновить индекс кэша mp3: %s", e)
+        yield _path(digest)
+
+
+async def cleanup():
+    """Удаляет брошенные .tmp и файлы без записи в индексе (вызывается при старте)."""
+    os.makedirs(AUDIO_CACHE_DIR, exist_ok=True)
+    async with async_session() as session:
+        known = set(await session.scalars(select(AudioFile.digest).distinct()))
+
+    now = time.time()
+    for root, _, names in os.walk(AUDIO_CACHE_DIR):
+        for name in names:
+            path = os.path.join(root, name)
+            digest, ext = os.path.splitext(name)
+            if ext == ".mp3" and digest in known:
+                continue
+            try:
+                if now - os.path.getmtime(path) > STALE_FILE_AGE:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+async def stats():
+    files = _files()
+    async with async_session() as session:
+        row = (await session.execute(
+            select(func.count(), func.coalesce(func.sum(files.c.size), 0))
+        )).one()
+    return {"files": row[0], "bytes": row[1], "budget": AUDIO_CACHE_BYTES, "in_use": len(_pinned)}
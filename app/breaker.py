@@ -0,0 +1,192 @@
+"""
+Здоровье источников: circuit breaker на каждый источник и «хеджирование» запросов.
+- После BREAKER_FAILURES ошибок подряд источник выключается на BREAKER_COOLDOWN:
+  вызовы сразу получают ProviderUnavailable, а не ждут таймаут.
+  После паузы пропускается один пробный запрос: удачный — источник снова включён,
+  неудачный — ещё одна пауза.
+- hedge=True: если первая попытка не ответила за p95 своего вида запросов,
+  параллельно уходит вторая, берётся та, что ответит первой.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+
+import aiohttp
+
+from app import metrics
+from app.settings import (
+    BREAKER_FAILURES, BREAKER_COOLDOWN, BREAKER_SLOW_CALL, HEDGE_MIN_SAMPLES, HEDGE_MIN_DELAY,
+    LATENCY_WINDOW
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderUnavailable(Exception):
+    """Источник выключен breaker'ом, запрос не отправлялся."""
+
+
+class UpstreamError(Exception):
+    """Источник ответил ошибкой (5xx, 429) — засчитывается breaker'у."""
+
+
+# только это говорит о здоровье источника; прочие ошибки (битый запрос, разбор ответа)
+# случаются до сети или на нашей стороне и breaker'у не засчитываются
+UPSTREAM_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, UpstreamError)
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.name = name
+        self.max_failures = failures
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+    def allow(self):
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN and not self.probing:
+            self.probing = True   # пропускаем ровно один пробный запрос
+            return True
+        return False
+
+    def success(self):
+        if self.state != self.CLOSED:
+            logger.info("[%s] источник снова доступен", self.name)
+        self.state = self.CLOSED
+        self.failures = 0
+        self.probing = False
+
+    def release(self):
+        """Вызов ничего не сказал об источнике — освобождаем место пробного запроса."""
+        self.probing = False
+
+    def failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.state == self.HALF_OPEN or self.failures >= self.max_failures:
+            if self.state != self.OPEN:
+                metrics.inc("breaker_open_total", provider=self.name)
+                logger.warning("[%s] источник выключен на %s с после %d ошибок",
+                               self.name, self.cooldown, self.failures)
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class LatencyWindow:
+    """Последние LATENCY_WINDOW длительностей удачных запросов одного вида."""
+
+    def __init__(self, size=LATENCY_WINDOW):
+        self.samples = deque(maxlen=size)
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+
+    def p95(self):
+        if len(self.samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+
+_breakers = {}
+_latency = {}
+
+
+def breaker(name):
+    if name not in _breakers:
+        _breakers[name] = CircuitBreaker(name)
+    return _breakers[name]
+
+
+def latency(name, kind):
+    key = (name, kind)
+    if key not in _latency:
+        _latency[key] = LatencyWindow()
+    return _latency[key]
+
+
+async def _attempt(cb, window, factory):
+    start = time.monotonic()
+    try:
+        result = await factory()
+    except asyncio.CancelledError:
+        # отменили по дедлайну поиска: долгий запрос — тоже признак больного источника
+        if time.monotonic() - start >= BREAKER_SLOW_CALL:
+            cb.failure()
+        else:
+            # быстрая отмена ничего не говорит об источнике, но пробный запрос
+            # должен освободиться, иначе allow() больше никого не пропустит
+            cb.release()
+        raise
+    except UPSTREAM_ERRORS:
+        cb.failure()
+        raise
+    except Exception:
+        cb.release()
+        raise
+    window.add(time.monotonic() - start)
+    cb.success()
+    return result
+
+
+async def _hedged(cb, window, factory, name, kind):
+    delay = window.p95()
+    first = asyncio.create_task(_attempt(cb, window, factory))
+    if delay is None or cb.state != cb.CLOSED:
+        return await first
+
+    tasks = {first}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=max(delay, HEDGE_MIN_DELAY))
+        if not done:
+            metrics.inc("hedge_total", provider=name, kind=kind)
+            tasks.add(asyncio.create_task(_attempt(cb, window, factory)))
+
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                # ошибка одной попытки не важна, пока вторая ещё идёт
+                if task.exception() is None or not tasks:
+                    if task is not first:
+                        metrics.inc("hedge_won_total", provider=name, kind=kind)
+                    return task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def guarded(name, factory, *, kind="request", hedge=False):
+    """
+    Вызывает factory() (корутина запроса к источнику name) под breaker'ом.
+    Бросает ProviderUnavailable, если источник выключен.
+    """
+    cb = breaker(name)
+    if not cb.allow():
+        metrics.inc("breaker_rejected_total", provider=name)
+        raise ProviderUnavailable(f"{name} временно недоступен")
+
+    window = latency(name, kind)
+    if hedge:
+        return await _hedged(cb, window, factory, name, kind)
+    return await _attempt(cb, window, factory)
+
+
+def stats():
+    return {
+        name: {
+            "state": cb.state,
+            "failures": cb.failures,
+            **{f"p95_{kind}": window.p95() for (provider, kind), window in _latency.items()
+               if provider == name and window.p95() is not None},
+        }
+        for name, cb in _breakers.items()
+    }
@@ -0,0 +1,105 @@
+"""
+Простой in-process кэш: TTL + LRU, лимит по числу записей и по байтам.
+"""
+import sys
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    def __init__(self, max_entries=1000, max_bytes=None, ttl=300, sizeof=sys.getsizeof,
+                 on_evict=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self.on_evict = on_evict     # on_evict(key, value) — когда запись уходит из кэша
+
+        self._data = OrderedDict()   # key -> (expires_at, size, value)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        item = self._data.get(key)
+        return item is not None and item[0] > time.monotonic()
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+
+        expires_at, _, value = item
+        if expires_at <= time.monotonic():
+            self.pop(key)
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.pop(key)
+
+        size = self.sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            self._evicted(key, value)
+            return
+
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, size, value)
+        self.bytes += size
+        self._shrink()
+
+    def pop(self, key, default=None, notify=True):
+        """
+        Убирает запись и возвращает значение.
+        notify=False — значение забирает вызывающий, on_evict не вызывается.
+        """
+        item = self._data.pop(key, None)
+        if item is None:
+            return default
+        self.bytes -= item[1]
+        if notify:
+            self._evicted(key, item[2])
+        return item[2]
+
+    def values(self):
+        """Живые (не истёкшие) значения, без учёта в hits/misses."""
+        now = time.monotonic()
+        return [value for expires_at, _, value in self._data.values() if expires_at > now]
+
+    def clear(self):
+        for key in list(self._data):
+            self.pop(key)
+
+    def _shrink(self):
+        while self._data and (
+            len(self._data) > self.max_entries
+            or (self.max_bytes is not None and self.bytes > self.max_bytes)
+        ):
+            key, (_, size, value) = self._data.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+            self._evicted(key, value)
+
+    def _evicted(self, key, value):
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,92 @@
+"""
+Отложенная запись: вставки копятся в памяти и раз в DB_FLUSH_INTERVAL
+(или когда набралось DB_BATCH_SIZE строк) уходят в базу одной транзакцией.
+Строки группируются по модели — на каждую модель один executemany.
+"""
+import asyncio
+import logging
+
+from sqlalchemy.dialects.sqlite import insert
+
+from app.database.models import async_session
+from app.settings import DB_FLUSH_INTERVAL, DB_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehind:
+    def __init__(self, interval=DB_FLUSH_INTERVAL, batch_size=DB_BATCH_SIZE):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._pending = {}     # (model, ignore_conflicts) -> [row, ...]
+        self._count = 0
+        self._wakeup = None
+        self._task = None
+        self._flush_lock = None
+        self._stopping = False
+        self.flushed = 0
+        self.failed = 0
+
+    def insert(self, model, row: dict, ignore_conflicts=False):
+        """
+        Ставит строку в очередь на вставку.
+        ignore_conflicts=True — INSERT ... ON CONFLICT DO NOTHING.
+        """
+        self._pending.setdefault((model, ignore_conflicts), []).append(row)
+        self._count += 1
+        self._start()
+        if self._count >= self.batch_size:
+            self._wakeup.set()
+
+    def _start(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def _statement(self, model, ignore_conflicts):
+        statement = insert(model)
+        return statement.on_conflict_do_nothing() if ignore_conflicts else statement
+
+    async def flush(self):
+        """Пишет всё накопленное одной транзакцией."""
+        if not self._pending:
+            return
+        async with self._flush_lock:
+            pending, self._pending, self._count = self._pending, {}, 0
+            rows = sum(len(r) for r in pending.values())
+            try:
+                async with async_session() as session:
+                    for (model, ignore_conflicts), batch in pending.items():
+                        await session.execute(self._statement(model, ignore_conflicts), batch)
+                    await session.commit()
+                self.flushed += rows
+            except Exception as e:
+                self.failed += rows
+                logger.error("Не удалось записать пачку (%d строк): %s", rows, e)
+
+    async def stop(self):
+        """Останавливает фоновую запись и дописывает остаток (при остановке бота)."""
+        # не отменяем задачу: отмена посреди flush потеряла бы уже снятую пачку
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def stats(self):
+        return {"pending": self._count, "flushed": self.flushed, "failed": self.failed}
+
+
+writes = WriteBehind()
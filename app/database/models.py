@@ -1,14 +1,29 @@
-from sqlalchemy import ForeignKey, String, BigInteger
+from sqlalchemy import ForeignKey, String, BigInteger, Float, Text, event, text
 from sqlalchemy.orm import Mapped, mapped_column, DeclarativeBase, relationship
 from sqlalchemy.ext.asyncio import AsyncAttrs, async_sessionmaker, create_async_engine
 
+from app.settings import DB_URL, DB_ECHO, DB_BUSY_TIMEOUT
 
-engine = create_async_engine(url="sqlite+aiosqlite:///db.sqlite3",
-                             echo=True)
+
+engine = create_async_engine(url=DB_URL,
+                             echo=DB_ECHO)
 
 async_session = async_sessionmaker(engine)
 
 
+@event.listens_for(engine.sync_engine, "connect")
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL: читатели не ждут писателя; synchronous=NORMAL в WAL безопасен и не fsync-ит каждый коммит
+    if engine.dialect.name != "sqlite":
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(DB_BUSY_TIMEOUT)}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
 class Base(AsyncAttrs, DeclarativeBase):
     pass
 
@@ -17,9 +32,59 @@ class User(Base):
     __tablename__ = 'users'
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    tg_id = mapped_column(BigInteger)
+    tg_id = mapped_column(BigInteger, unique=True, index=True)
+
+
+class TrackFile(Base):
+    __tablename__ = 'track_files'
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    track_key: Mapped[str] = mapped_column(String(1024), unique=True)
+    file_id: Mapped[str] = mapped_column(String(256))
+
+
+class AudioFile(Base):
+    """Индекс локального кэша mp3 (app/audio_cache.py): ключ трека -> файл по хэшу содержимого."""
+    __tablename__ = 'audio_files'
+
+    track_key: Mapped[str] = mapped_column(String(1024), primary_key=True)
+    digest: Mapped[str] = mapped_column(String(64), index=True)   # sha256, он же имя файла
+    size: Mapped[int] = mapped_column(BigInteger)
+    last_used: Mapped[float] = mapped_column(Float, index=True)
+
+
+# --- Выдача пользователей при SESSION_BACKEND = "sqlite" (app/state.py) ---
+
+class ChatSession(Base):
+    __tablename__ = 'chat_sessions'
+
+    user_id = mapped_column(BigInteger, primary_key=True)
+    version: Mapped[int] = mapped_column()
+    tracks: Mapped[str] = mapped_column(Text)          # JSON
+    expires_at: Mapped[float] = mapped_column(Float, index=True)
+
+
+class InlineSession(Base):
+    __tablename__ = 'inline_sessions'
+    __table_args__ = {"sqlite_autoincrement": True}   # id не переиспользуются после очистки
+
+    id: Mapped[int] = mapped_column(primary_key=True)  # set_id в id inline-результатов
+    user_id = mapped_column(BigInteger)
+    tracks: Mapped[str] = mapped_column(Text)
+    expires_at: Mapped[float] = mapped_column(Float, index=True)
+
+
+async def _migrate(conn):
+    # таблица users могла быть создана без индекса — убираем дубли и добавляем его
+    await conn.execute(text(
+        "DELETE FROM users WHERE id NOT IN (SELECT MIN(id) FROM users GROUP BY tg_id)"
+    ))
+    await conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_users_tg_id ON users (tg_id)"
+    ))
 
 
 async def async_main():
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
+        await conn.run_sync(Base.metadata.create_all)
+        await _migrate(conn)
@@ -1,32 +1,95 @@
-import aiohttp
 import io
+import os
+import logging
+import heapq
 import re
+from contextlib import asynccontextmanager, AsyncExitStack
 import json
 import uuid
 import asyncio
-from rapidfuzz import fuzz
+from rapidfuzz import fuzz, process
 from urllib.parse import urljoin
-from app.database.models import User, async_session
+from app.database.models import User, TrackFile, async_session
 from sqlalchemy import select, update, delete, desc
-from bs4 import BeautifulSoup
+from sqlalchemy.dialects.sqlite import insert
 import idna
 
+from app import audio_cache, http, metrics, resolver
+from app.breaker import guarded, ProviderUnavailable, UpstreamError
+from app.download import download_to_file, probe_url, claim_prefetched, DownloadError
+from app.parsers import parse_skysound_page, skysound_artist_url
+from app.database.batcher import writes
+from app.settings import (
+    RANK_WEIGHTS, DB_WRITE_BEHIND, SOUNDCLOUD_API, HEDGE_RESOLVE, HEDGE_SEARCH, DOWNLOAD_PROBE,
+    AUDIO_CACHE_ENABLED
+)
 
 
-from config import SOUNDCLOUD_CLIENT_ID, proxy_url
+
+from config import SOUNDCLOUD_CLIENT_ID
+
+logger = logging.getLogger(__name__)
 
 async def set_user(tg_id):
+    # уже существующий tg_id молча пропускается уникальным индексом
+    if DB_WRITE_BEHIND:
+        writes.insert(User, {"tg_id": tg_id}, ignore_conflicts=True)
+        return
+
+    async with async_session() as session:
+        await session.execute(insert(User).values(tg_id=tg_id).on_conflict_do_nothing())
+        await session.commit()
+
+
+# --- Кэш file_id Telegram ---
+
+def track_key(track) -> str:
+    """Стабильный ключ трека: источник + ссылка."""
+    return f"{track['source']}:{track['url']}"
+
+
+async def get_file_id(key: str):
+    async with async_session() as session:
+        return await session.scalar(select(TrackFile.file_id).where(TrackFile.track_key == key))
+
+
+async def set_file_id(key: str, file_id: str):
+    # одна атомарная вставка: два процесса, загрузившие один трек, не упрутся в уникальный ключ
+    statement = insert(TrackFile).values(track_key=key, file_id=file_id)
+    statement = statement.on_conflict_do_update(
+        index_elements=[TrackFile.track_key],
+        set_={"file_id": statement.excluded.file_id},
+    )
     async with async_session() as session:
-        user = await session.scalar(select(User).where(User.tg_id == tg_id))
+        await session.execute(statement)
+        await session.commit()
 
-        if not user:
-            session.add(User(tg_id=tg_id))
-            await session.commit()
+
+async def delete_file_id(key: str):
+    async with async_session() as session:
+        await session.execute(delete(TrackFile).where(TrackFile.track_key == key))
+        await session.commit()
 
 
 
 HEADERS = {"User-Agent": "Mozilla/5.0"}
 
+
+async def _fetch(provider, url, *, kind, hedge=False, as_json=False, **kwargs):
+    """
+    GET к источнику через его circuit breaker (app/breaker.py) -> (статус, тело).
+    5xx и 429 считаются отказом источника; ProviderUnavailable — источник выключен.
+    """
+    async def attempt():
+        async with http.get(url, **kwargs) as resp:
+            if resp.status >= 500 or resp.status == 429:
+                raise UpstreamError(f"HTTP {resp.status}")
+            if resp.status != 200:
+                return resp.status, None
+            return resp.status, await (resp.json() if as_json else resp.text())
+
+    return await guarded(provider, attempt, kind=kind, hedge=hedge)
+
 # --- SoundCloud поиск ---
 
 async def get_soundcloud_mp3_url(transcoding_url: str):
@@ -43,43 +106,47 @@ async def get_soundcloud_mp3_url(transcoding_url: str):
     }
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(full_url, headers=headers, proxy=proxy_url) as r:
-                if r.status != 200:
-                    print(f"⚠ Ошибка запроса transcoding: {r.status}")
-                    return None
-
-                data = await r.json()
-                print("transcoding response json keys:", data.keys())
-                if "url" in data:
-                    print("soundcloud direct url:", data["url"])
-                    return data["url"]
-
+        status, data = await _fetch(
+            "SoundCloud", full_url, kind="resolve", hedge=HEDGE_RESOLVE, as_json=True,
+            headers=headers, use_proxy=True
+        )
+    except ProviderUnavailable:
+        return None
     except Exception as e:
-        print(f"💥 Ошибка transcoding запроса: {e}")
+        logger.warning("Ошибка transcoding запроса: %s", e)
+        return None
+
+    if status != 200:
+        logger.warning("Ошибка запроса transcoding: %s", status)
         return None
 
+    if "url" in data:
+        logger.debug("SoundCloud direct url: %s", data["url"])
+        return data["url"]
+
     return None
 
 
 async def search_soundcloud(query: str):
-    print(f"\n🔎 [SoundCloud] Поиск: '{query}'")
+    logger.debug("[SoundCloud] Поиск: %r", query)
 
     url = (
-        "https://api-v2.soundcloud.com/search/tracks"
+        f"{SOUNDCLOUD_API}/search/tracks"
         f"?q={query}&client_id={SOUNDCLOUD_CLIENT_ID}&limit=30"
     )
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, proxy=proxy_url) as r:
-                if r.status != 200:
-                    print(f"⚠ SC error {r.status}")
-                    return []
-                data = await r.json()
-
+        status, data = await _fetch(
+            "SoundCloud", url, kind="search", hedge=HEDGE_SEARCH, as_json=True, use_proxy=True
+        )
+    except ProviderUnavailable:
+        raise
     except Exception as e:
-        print(f"💥 SC ошибка: {e}")
+        logger.warning("[SoundCloud] ошибка: %s", e)
+        return []
+
+    if status != 200:
+        logger.warning("[SoundCloud] ошибка %s", status)
         return []
 
     results = []
@@ -122,97 +189,62 @@ async def search_soundcloud(query: str):
             "source": "SoundCloud"
         })
 
-    print(f"🎶 SC найдено треков: {len(results)}")
+    logger.debug("[SoundCloud] найдено треков: %d", len(results))
     return results
 
 
+def normalize_query(query: str) -> str:
+    """
+    Приводит запрос к виду поддомена SkySound:
+    нижний регистр, всё кроме букв и цифр — в один дефис.
+    """
+    slug = query.strip().lower()
+    slug = re.sub(r"[^a-zа-я0-9]+", "-", slug)
+    return re.sub(r"-{2,}", "-", slug).strip("-")
+
+
 async def search_skysound(artist_query: str):
 
-    artist_raw = artist_query.strip().lower()
-    artist_raw = re.sub(r"[^a-zа-я0-9]+", "-", artist_raw)
-    artist_raw = re.sub(r"-{2,}", "-", artist_raw).strip("-")
+    artist_raw = normalize_query(artist_query)
 
+    # поддомен: пустой (запрос из одних эмодзи) или длиннее 63 символов — такой страницы нет,
+    # а до сети запрос всё равно не дойдёт
     try:
         artist_domain = idna.encode(artist_raw).decode()
-    except:
-        artist_domain = artist_raw
+    except UnicodeError:   # idna.IDNAError и ошибки кодека
+        return []
+    if not artist_domain or len(artist_domain) > 63:
+        return []
 
-    url = f"https://{artist_domain}.skysound7.com/"
-    print(f"\n🌐 [SkySearch] URL артиста: {url}")
+    url = skysound_artist_url(artist_domain)
+    logger.debug("[SkySound] URL артиста: %s", url)
 
     headers = {
         "User-Agent": "Mozilla/5.0",
         "Referer": "https://skysound7.com/"
     }
 
-    tracks = []
-    seen = set()
-
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers, timeout=12) as resp:
-                print("📡 Код:", resp.status)
-                if resp.status != 200:
-                    return []
-
-                html = await resp.text()
-
+        status, html = await _fetch(
+            "SkySound", url, kind="search", hedge=HEDGE_SEARCH, headers=headers, timeout=12
+        )
+    except ProviderUnavailable:
+        raise
     except Exception as e:
-        print("❌ Ошибка соединения:", e)
+        logger.warning("[SkySound] ошибка соединения: %s", e)
         return []
 
-    soup = BeautifulSoup(html, "html.parser")
-    playlist_items = soup.select("div.playlist-item")
-
-    if not playlist_items:
-        print("🚫 playlist-item не найден")
+    logger.debug("[SkySound] код ответа: %s", status)
+    if status != 200:
         return []
 
-    for item in playlist_items:
+    tracks = await parse_skysound_page(html, artist_domain)
 
-        link = item.find("a", href=True)
-        if not link:
-            continue
-
-        href = link["href"].strip()
-        if not href.startswith("http"):
-            href = f"https://{artist_domain}.skysound7.com{href}"
-
-        if href in seen:
-            continue
-        seen.add(href)
-
-        # название
-        title_raw = (link.get("title") or link.text or "").strip()
-        title_raw = re.sub(r"\b(скачать|download|слушать)\b", "", title_raw, flags=re.I)
-        title_raw = title_raw.strip(" -\u2013\u2014")
-
-        if " - " in title_raw:
-            artist, title = title_raw.split(" - ", 1)
-        else:
-            artist = "Неизвестен"
-            title = title_raw or "Без названия"
-
-        # длительность
-        duration = "?:??"
-        dur = item.select_one("div.playlist-right span.playlist-duration")
-        if dur:
-            duration = dur.text.strip()
-
-        # === ОБЛОЖКА ===
-        img = item.select_one(".playlist-left img")
-        thumb = img["src"] if img and img.get("src") else None
-
-        tracks.append({
-            "title": title,
-            "artist": artist,
-            "url": href,
-            "duration": duration,
-            "thumb": thumb,   # <── Теперь есть обложка!
-            "source": "SkySound"
-        })
+    if not tracks:
+        logger.debug("[SkySound] playlist-item не найден")
+        return []
 
-    print(f"🎵 Найдено треков: {len(tracks)}")
+    logger.debug("[SkySound] найдено треков: %d", len(tracks))
     return tracks
 
 
@@ -227,14 +259,16 @@ async def get_skysound_mp3(track_page_url: str):
         "Referer": track_page_url
     }
 
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(track_page_url, headers=headers, timeout=12) as resp:
-                if resp.status != 200:
-                    return None
-                html = await resp.text()
-        except:
-            return None
+    try:
+        status, html = await _fetch(
+            "SkySound", track_page_url, kind="resolve", hedge=HEDGE_RESOLVE,
+            headers=headers, timeout=12
+        )
+    except Exception:
+        return None
+
+    if status != 200:
+        return None
 
     # === Ищем ИМЕННО 'file: "...mp3"' ===
     file_match = re.search(r'file:\s*"([^"]+\.mp3)"', html)
@@ -247,89 +281,180 @@ async def get_skysound_mp3(track_page_url: str):
     # Если нашли только preview — значит полного файла НЕТ
     return None
 
-def rank_tracks_by_similarity(query: str, tracks: list):
+def _bulk_scores(query: str, choices: list):
+    """
+    partial_ratio запроса со всеми строками сразу (цикл внутри rapidfuzz).
+    Одинаковые строки (исполнитель на странице артиста) считаются один раз.
+    """
+    unique = list(dict.fromkeys(choices))
+    by_text = dict.fromkeys(unique, 0.0)
+    for text, score, _ in process.extract(
+        query, unique, scorer=fuzz.partial_ratio, processor=None, limit=None
+    ):
+        by_text[text] = score
+    return [by_text[text] for text in choices]
+
+
+def _duration_seconds(duration: str):
+    try:
+        minutes, seconds = duration.split(":")
+        return int(minutes) * 60 + int(seconds)
+    except (ValueError, AttributeError):
+        return None
+
+
+def rank_tracks_by_similarity(query: str, tracks: list, top_k: int = None, weights: dict = None):
     """
     Ранжирует треки по схожести с запросом пользователя.
-    Использует fuzzy matching по названию и исполнителю.
+    Использует fuzzy matching по названию и исполнителю, пачкой через rapidfuzz.process.
+    weights — см. RANK_WEIGHTS; top_k — вернуть только лучшие k треков.
     """
-    ranked = []
-    for track in tracks:
-        title = track.get("title", "").lower()
-        artist = track.get("artist", "").lower()
-        q = query.lower()
+    if not tracks:
+        return []
 
-        # Считаем схожесть по названию и исполнителю
-        score_title = fuzz.partial_ratio(q, title)
-        score_artist = fuzz.partial_ratio(q, artist)
-        score_total = max(score_title, score_artist)
+    weights = weights or RANK_WEIGHTS
+    q = query.lower()
 
-        ranked.append((score_total, track))
+    titles = [(track.get("title") or "").lower() for track in tracks]
+    artists = [(track.get("artist") or "").lower() for track in tracks]
 
-    # Сортируем по убыванию похожести
-    ranked.sort(key=lambda x: x[0], reverse=True)
-    sorted_tracks = [t for _, t in ranked]
-    return sorted_tracks
+    # Считаем схожесть по названию и исполнителю
+    title_scores = _bulk_scores(q, titles)
+    artist_scores = _bulk_scores(q, artists)
 
+    w_title = weights.get("title", 1.0)
+    w_artist = weights.get("artist", 1.0)
+    w_source = weights.get("source") or {}
+    w_duration = weights.get("duration", 0.0)
+
+    scores = []
+    for i, track in enumerate(tracks):
+        score = max(w_title * title_scores[i], w_artist * artist_scores[i])
+
+        if w_source:
+            score += w_source.get(track.get("source"), 0.0)
+
+        if w_duration:
+            seconds = _duration_seconds(track.get("duration"))
+            if seconds and 60 <= seconds <= 900:
+                score += w_duration
+
+        scores.append(score)
+
+    # Сортируем по убыванию похожести (при равенстве — исходный порядок)
+    order = range(len(tracks))
+    if top_k is not None:
+        order = heapq.nlargest(top_k, order, key=scores.__getitem__)
+    else:
+        order = sorted(order, key=scores.__getitem__, reverse=True)
+
+    return [tracks[i] for i in order]
+
+
+async def resolve_mp3_url(track):
+    """Прямая ссылка на полный mp3 для трека из выдачи (через кэш resolver)."""
+    return await resolver.resolve(track_key(track), lambda: _resolve_mp3_url(track))
+
+
+async def _resolve_mp3_url(track):
+    if track["source"] == "SoundCloud":
+        return await get_soundcloud_mp3_url(track["url"])
+
+    if track["source"] == "SkySound":
+        return await get_skysound_mp3(track["url"])
+
+    return None
 
+
+def track_headers(track):
+    """Заголовки для скачивания mp3 этого трека."""
+    return {
+        "User-Agent": "Mozilla/5.0",
+        "Referer": (
+            "https://soundcloud.com/"
+            if track["source"] == "SoundCloud"
+            else "https://skysound7.com/"
+        )
+    }
+
+
+async def _fetch_mp3(mp3_url, headers, stack):
+    # проверка первых байт и размера: неподходящий файл отсекаем, не скачивая целиком;
+    # заодно узнаём размер и поддержку Range для скачивания кусками
+    probe = await probe_url(mp3_url, headers=headers) if DOWNLOAD_PROBE else None
+    return await stack.enter_async_context(download_to_file(mp3_url, headers=headers, probe=probe))
+
+
+async def _download_source(track, stack):
+    """Качает один источник трека; путь к файлу или None."""
+    headers = track_headers(track)
+
+    try:
+        mp3_url = await resolve_mp3_url(track)
+        if not mp3_url:
+            raise DownloadError(f"Не удалось получить mp3 от {track['source']}")
+
+        try:
+            return await _fetch_mp3(mp3_url, headers, stack)
+        except DownloadError as e:
+            if e.status not in (403, 410):
+                raise
+            # подпись ссылки истекла — сбрасываем кэш и пробуем один раз заново
+            resolver.invalidate(track_key(track))
+            mp3_url = await resolve_mp3_url(track)
+            if not mp3_url:
+                raise
+            return await _fetch_mp3(mp3_url, headers, stack)
+
+    except Exception as e:
+        metrics.inc("download_errors_total", source=track["source"])
+        logger.warning("Ошибка в download_track() [%s]: %s", track["source"], e)
+        return None
+
+
+@asynccontextmanager
 async def download_track(track):
     """
     track = {
         "source": "SoundCloud" / "SkySound",
         "url": "...",
         "artist": "...",
-        "title": "..."
+        "title": "...",
+        "alternates": [...]   # тот же трек из других источников, необязательно
     }
+    Отдаёт путь к mp3 трека (или None при ошибке): из локального кэша (app/audio_cache.py),
+    иначе качает — сначала основной источник, потом alternates по очереди.
+    Скачанный файл кладётся в кэш, и отдаётся уже копия из кэша.
+    Временные файлы удаляются при выходе из async with.
+
+        async with download_track(track) as path:
+            if path:
+                await bot.send_audio(chat_id, FSInputFile(path))
     """
-    url = track["url"]
-
-    try:
-        mp3_url = None
-
-        # --------------------------
-        # 1. SoundCloud
-        # --------------------------
-        if track["source"] == "SoundCloud":
-            mp3_url = await get_soundcloud_mp3_url(url)
-            if not mp3_url:
-                raise Exception("Не удалось получить mp3_url от SoundCloud")
-
-        # --------------------------
-        # 2. SkySound
-        # --------------------------
+    candidates = (track, *(track.get("alternates") or ()))
+
+    async with AsyncExitStack() as stack:
+        # трек уже лежит в локальном кэше — скачивать не нужно
+        if AUDIO_CACHE_ENABLED:
+            path = await stack.enter_async_context(audio_cache.use([track_key(c) for c in candidates]))
+            if path:
+                yield path
+                return
+
+        # трек уже скачан предзагрузкой — берём готовый файл
+        keys = [track_key(track)]
+        path = await claim_prefetched(keys[0])
+        if path:
+            stack.callback(os.remove, path)
         else:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=15) as resp:
-                    html = await resp.text()
-
-            mp3_links = re.findall(r'https:\/\/[^\s"]+\.mp3', html)
-            if not mp3_links:
-                raise Exception("MP3 не найден на SkySound")
-            mp3_url = mp3_links[0]
-
-        # --------------------------
-        # 3. Качаем файл MP3
-        # --------------------------
-        headers = {
-            "User-Agent": "Mozilla/5.0",
-            "Referer": (
-                "https://soundcloud.com/"
-                if track["source"] == "SoundCloud"
-                else "https://skysound7.com/"
-            )
-        }
-
-        async with aiohttp.ClientSession() as session:
-            async with session.get(mp3_url, headers=headers, timeout=30) as resp:
-                if resp.status != 200:
-                    raise Exception(f"Ошибка HTTP {resp.status}")
-                audio_bytes = await resp.read()
-
-        if len(audio_bytes) < 50000:
-            raise Exception("Файл слишком маленький / повреждён")
-
-        return audio_bytes
+            for candidate in candidates:
+                path = await _download_source(candidate, stack)
+                if path:
+                    if candidate is not track:
+                        keys.append(track_key(candidate))
+                    break
 
-    except Exception as e:
-        print("❌ Ошибка в download_track():", e)
-        return None
+        if path and AUDIO_CACHE_ENABLED:
+            path = await stack.enter_async_context(audio_cache.store(keys, path)) or path
 
+        yield path
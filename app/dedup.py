@@ -0,0 +1,102 @@
+"""
+Склейка одинаковых треков из разных источников перед ранжированием.
+Отпечаток: нормализованные исполнитель и название (без feat./remix-пометок,
+кириллица в латиницу) + длительность с допуском DEDUP_DURATION_TOLERANCE.
+Склеиваются только треки разных источников — не больше одного от каждого: два трека
+одного источника (оригинал и live / remix) остаются отдельными кнопками.
+В выдаче остаётся лучший источник по DEDUP_SOURCE_PREFERENCE,
+остальные сохраняются в track["alternates"] — на них переходит download_track.
+"""
+import re
+
+from app.database.requests import _duration_seconds
+from app.settings import DEDUP_DURATION_TOLERANCE, DEDUP_SOURCE_PREFERENCE
+
+_TRANSLIT = str.maketrans({
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "e", "ж": "zh",
+    "з": "z", "и": "i", "й": "y", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o",
+    "п": "p", "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f", "х": "h", "ц": "ts",
+    "ч": "ch", "ш": "sh", "щ": "sch", "ъ": "", "ы": "y", "ь": "", "э": "e", "ю": "yu",
+    "я": "ya",
+})
+
+# (feat. X), [Official Audio], (X Remix) ...
+_BRACKETS = re.compile(r"[(\[][^)\]]*[)\]]")
+# feat. X / ft X / featuring X / prod. X — до конца строки
+_FEAT = re.compile(r"\b(feat|ft|featuring|prod)\b\.?.*$")
+_MARKERS = re.compile(r"\b(remix|original mix|radio edit|official|audio|video|lyrics)\b")
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_text(text: str) -> str:
+    text = (text or "").lower().translate(_TRANSLIT)
+    text = _BRACKETS.sub(" ", text)
+    text = _FEAT.sub(" ", text)
+    text = _MARKERS.sub(" ", text)
+    return _NON_WORD.sub(" ", text).strip()
+
+
+def fingerprint(track):
+    """(исполнитель, название) — длительность сравнивается отдельно, с допуском."""
+    artist = normalize_text(track.get("artist"))
+    title = normalize_text(track.get("title"))
+
+    # SoundCloud часто кладёт "Исполнитель - Название" в title, а в artist — ник загрузившего
+    if " - " in (track.get("title") or ""):
+        artist_part, title_part = track["title"].split(" - ", 1)
+        artist, title = normalize_text(artist_part), normalize_text(title_part)
+
+    return artist, title
+
+
+def _source_rank(track):
+    source = track.get("source")
+    if source in DEDUP_SOURCE_PREFERENCE:
+        return DEDUP_SOURCE_PREFERENCE.index(source)
+    return len(DEDUP_SOURCE_PREFERENCE)
+
+
+def dedup_tracks(tracks: list):
+    """
+    Возвращает треки без дублей (в порядке первого появления).
+    Отброшенные копии лежат в track["alternates"] оставшегося трека.
+    """
+    clusters = []          # [[track, ...], ...] в порядке появления
+    sources = []           # источники каждого кластера — от источника не больше одного трека
+    by_fingerprint = {}    # fingerprint -> [(секунды, индекс кластера), ...]
+
+    for track in tracks:
+        fp = fingerprint(track)
+        seconds = _duration_seconds(track.get("duration"))
+        source = track.get("source")
+
+        cluster = None
+        if fp[1]:
+            for other_seconds, index in by_fingerprint.get(fp, ()):
+                if source in sources[index]:
+                    continue
+                if seconds is None or other_seconds is None \
+                        or abs(seconds - other_seconds) <= DEDUP_DURATION_TOLERANCE:
+                    cluster = index
+                    break
+
+        if cluster is None:
+            cluster = len(clusters)
+            clusters.append([])
+            sources.append(set())
+            by_fingerprint.setdefault(fp, []).append((seconds, cluster))
+
+        clusters[cluster].append(track)
+        sources[cluster].add(source)
+
+    result = []
+    for cluster in clusters:
+        if len(cluster) == 1:
+            result.append(cluster[0])
+            continue
+
+        # sorted стабилен: при равном источнике остаётся тот, что пришёл раньше
+        best, *alternates = sorted(cluster, key=_source_rank)
+        result.append({**best, "alternates": alternates})
+
+    return result
@@ -0,0 +1,321 @@
+"""
+Потоковое скачивание mp3 во временный файл.
+Куски пишутся на диск по мере прихода, в памяти держится только один кусок.
+Лимиты размера проверяются на лету, файл удаляется при выходе из контекста.
+До скачивания probe_url забирает первые байты (Range) — битые, слишком большие
+и не-mp3 ответы отсекаются, не скачав файл целиком.
+Большой файл с сервера, умеющего Range, качается кусками в несколько соединений:
+файл заранее выделяется целиком, куски пишутся на свои места через os.pwrite.
+"""
+import asyncio
+import os
+import tempfile
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from app import http, metrics
+from app.cache import TTLCache
+from app.settings import (
+    DOWNLOAD_DIR, DOWNLOAD_CHUNK_SIZE, DOWNLOAD_MIN_SIZE, DOWNLOAD_MAX_SIZE, DOWNLOAD_TIMEOUT,
+    DOWNLOAD_PROBE_BYTES, DOWNLOAD_PARALLEL_MIN_SIZE, DOWNLOAD_PARALLEL,
+    DOWNLOAD_PART_MIN, DOWNLOAD_PART_MAX,
+    PREFETCH_CACHE_TTL, PREFETCH_CACHE_BYTES
+)
+
+SPOOL_DIR = DOWNLOAD_DIR or os.path.join(tempfile.gettempdir(), "eschalon-spool")
+PREFETCH_DIR = os.path.join(SPOOL_DIR, "prefetch")
+SPOOL_PREFIX = "spool-"
+SPOOL_STALE_AGE = 3600   # сек; более свежие файлы может ещё отправлять соседний процесс
+
+
+class DownloadError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+def cleanup_spool():
+    """
+    Удаляет файлы, оставшиеся от прошлых запусков (вызывается при старте).
+    Трогает только свои давние файлы: DOWNLOAD_DIR может быть общим с другими
+    программами и с соседними процессами бота.
+    """
+    os.makedirs(PREFETCH_DIR, exist_ok=True)
+    now = time.time()
+    for directory in (SPOOL_DIR, PREFETCH_DIR):
+        for name in os.listdir(directory):
+            if not (name.startswith(SPOOL_PREFIX) and name.endswith(".mp3")):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                if now - os.path.getmtime(path) > SPOOL_STALE_AGE:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+def remove_file(path):
+    """os.remove без ошибки, если файла уже нет (общий для спула, кэшей mp3 и обложек)."""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+# --- Проверка, что по ссылке действительно mp3 подходящего размера ---
+
+# S3 и многие CDN отдают mp3 как octet-stream
+AUDIO_TYPES = ("audio/", "application/octet-stream", "binary/octet-stream")
+
+
+def _looks_like_mp3(sample):
+    # ID3-тег или синхрослово MPEG-кадра (11 единичных бит)
+    return sample[:3] == b"ID3" or (len(sample) > 1 and sample[0] == 0xFF and sample[1] & 0xE0 == 0xE0)
+
+
+def check_audio(content_type=None, size=None, sample=None,
+                min_size=DOWNLOAD_MIN_SIZE, max_size=DOWNLOAD_MAX_SIZE):
+    """Бросает DownloadError, если по заголовкам или первым байтам это не подходящий mp3."""
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    if media_type and not media_type.startswith(AUDIO_TYPES):
+        reason, message = "type", f"Не аудио: {media_type}"
+    elif size is not None and size > max_size:
+        reason, message = "too_large", f"Файл слишком большой: {size} байт"
+    elif size is not None and size < min_size:
+        reason, message = "too_small", f"Файл слишком маленький / повреждён: {size} байт"
+    elif sample is not None and not _looks_like_mp3(sample):
+        reason, message = "magic", "Нет заголовка MP3/ID3"
+    else:
+        return
+
+    metrics.inc("download_rejected_total", reason=reason)
+    raise DownloadError(message)
+
+
+def _total_size(resp):
+    # 206: "Content-Range: bytes 0-4095/5000000"; 200: сервер отдал файл целиком
+    if resp.status == 206:
+        total = resp.headers.get("Content-Range", "").rpartition("/")[2]
+        return int(total) if total.isdigit() else None
+    return resp.content_length
+
+
+async def probe_url(url, headers=None, timeout=DOWNLOAD_TIMEOUT, sample_size=DOWNLOAD_PROBE_BYTES):
+    """
+    Забирает первые sample_size байт (Range) и проверяет их check_audio.
+    Возвращает {"size", "content_type", "ranges", "sample"}; ranges — сервер умеет Range.
+    """
+    headers = {**(headers or {}), "Range": f"bytes=0-{sample_size - 1}"}
+    async with http.get(url, headers=headers, timeout=timeout) as resp:
+        if resp.status not in (200, 206):
+            raise DownloadError(f"HTTP {resp.status}", status=resp.status)
+
+        sample = b""
+        while len(sample) < sample_size:
+            chunk = await resp.content.read(sample_size - len(sample))
+            if not chunk:
+                break
+            sample += chunk
+
+        info = {
+            "size": _total_size(resp),
+            "content_type": resp.headers.get("Content-Type"),
+            "ranges": resp.status == 206,
+            "sample": sample,
+        }
+        # если сервер проигнорировал Range, остаток не читаем — соединение просто закроется
+
+    check_audio(info["content_type"], info["size"], sample)
+    return info
+
+
+class RangesUnsupported(DownloadError):
+    """Сервер ответил на запрос куска не 206 — качаем одним потоком."""
+
+
+async def _stream(fd, url, headers, timeout, min_size, max_size, throttle):
+    """Весь файл одним запросом; возвращает размер."""
+    async with http.get(url, headers=headers, timeout=timeout) as resp:
+        if resp.status != 200:
+            raise DownloadError(f"HTTP {resp.status}", status=resp.status)
+
+        check_audio(resp.headers.get("Content-Type"), resp.content_length,
+                    min_size=min_size, max_size=max_size)
+
+        size = 0
+        async for chunk in resp.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+            if not size:
+                check_audio(sample=chunk)
+            size += len(chunk)
+            if size > max_size:
+                raise DownloadError(f"Файл слишком большой: > {max_size} байт")
+            os.write(fd, chunk)
+            if throttle is not None:
+                await throttle(len(chunk))
+
+    if size < min_size:
+        raise DownloadError(f"Файл слишком маленький / повреждён: {size} байт")
+    return size
+
+
+def _plan_ranges(size, start=0):
+    """
+    Делит [start, size) на куски. Кусков больше, чем соединений: соединения
+    разбирают их по очереди, и быстрое успевает взять больше, чем медленное.
+    """
+    workers = max(1, min(DOWNLOAD_PARALLEL, (size - start) // DOWNLOAD_PART_MIN))
+    part = min(max((size - start) // (workers * 2), DOWNLOAD_PART_MIN), DOWNLOAD_PART_MAX)
+    ranges = [(offset, min(offset + part, size) - 1) for offset in range(start, size, part)]
+    return workers, ranges
+
+
+async def _fetch_range(fd, url, headers, timeout, first, last, throttle):
+    headers = {**(headers or {}), "Range": f"bytes={first}-{last}"}
+    async with http.get(url, headers=headers, timeout=timeout) as resp:
+        if resp.status == 200:
+            raise RangesUnsupported("Сервер игнорирует Range")
+        if resp.status != 206:
+            raise DownloadError(f"HTTP {resp.status}", status=resp.status)
+        if not resp.headers.get("Content-Range", "").startswith(f"bytes {first}-"):
+            raise RangesUnsupported(f"Неожиданный Content-Range: {resp.headers.get('Content-Range')}")
+
+        offset = first
+        async for chunk in resp.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+            if offset + len(chunk) > last + 1:
+                raise DownloadError(f"Кусок {first}-{last} длиннее запрошенного")
+            os.pwrite(fd, chunk, offset)
+            offset += len(chunk)
+            if throttle is not None:
+                await throttle(len(chunk))
+
+    if offset != last + 1:
+        raise DownloadError(f"Кусок {first}-{last} оборвался на {offset}")
+
+
+async def _download_ranges(fd, url, headers, timeout, probe, throttle):
+    """Файл размера probe["size"] кусками в несколько соединений; возвращает размер."""
+    size = probe["size"]
+    # место под весь файл сразу: куски пишутся не по порядку
+    if hasattr(os, "posix_fallocate"):
+        os.posix_fallocate(fd, 0, size)
+    else:
+        os.ftruncate(fd, size)
+
+    # начало файла уже пришло с probe_url
+    sample = probe["sample"][:size]
+    os.pwrite(fd, sample, 0)
+
+    workers, ranges = _plan_ranges(size, start=len(sample))
+    queue = iter(ranges)
+
+    async def worker():
+        for first, last in queue:
+            await _fetch_range(fd, url, headers, timeout, first, last, throttle)
+
+    tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+    try:
+        # первая ошибка останавливает остальные соединения
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return size
+
+
+@asynccontextmanager
+async def download_to_file(url, headers=None, timeout=DOWNLOAD_TIMEOUT,
+                           min_size=DOWNLOAD_MIN_SIZE, max_size=DOWNLOAD_MAX_SIZE, throttle=None,
+                           probe=None):
+    """
+    Качает url во временный файл и отдаёт путь к нему.
+    Бросает DownloadError, если ответ не 200 или размер вне [min_size, max_size].
+    throttle — корутина throttle(n_bytes), ограничивает скорость (для предзагрузки).
+    probe — результат probe_url: если сервер умеет Range и файл не меньше
+    DOWNLOAD_PARALLEL_MIN_SIZE, файл качается кусками параллельно.
+    """
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix=SPOOL_PREFIX, suffix=".mp3", dir=SPOOL_DIR)
+    start = time.perf_counter()
+
+    try:
+        try:
+            ranged = bool(probe and probe["ranges"] and probe["size"]
+                          and DOWNLOAD_PARALLEL_MIN_SIZE <= probe["size"] <= max_size)
+            if ranged:
+                try:
+                    size = await _download_ranges(fd, url, headers, timeout, probe, throttle)
+                except RangesUnsupported:
+                    ranged = False
+                    os.ftruncate(fd, 0)
+            if not ranged:
+                size = await _stream(fd, url, headers, timeout, min_size, max_size, throttle)
+        finally:
+            os.close(fd)
+
+        metrics.observe("download_seconds", time.perf_counter() - start,
+                        mode="ranges" if ranged else "stream")
+        metrics.observe("download_bytes", size)
+
+        yield path
+
+    finally:
+        remove_file(path)
+
+
+# --- Файлы, скачанные заранее (app/prefetch.py) ---
+
+prefetched_files = TTLCache(
+    max_bytes=PREFETCH_CACHE_BYTES,
+    ttl=PREFETCH_CACHE_TTL,
+    sizeof=os.path.getsize,
+    on_evict=lambda key, path: remove_file(path),
+)
+metrics.register_cache("prefetch", prefetched_files)
+_prefetching = {}   # track_key -> задача, которая сейчас качает этот трек
+_transferring = set()   # ключи, чей файл предзагрузка уже качает (а не ждёт очереди или ссылки)
+_claimed = set()        # ключи, которые ждёт пользователь: докачиваются без лимита скорости
+
+
+def add_prefetching(key, task):
+    if key in _prefetching:
+        return
+    _prefetching[key] = task
+    task.add_done_callback(lambda _: _prefetching.pop(key, None))
+
+
+@contextmanager
+def prefetch_transfer(key):
+    """Предзагрузка key перешла к скачиванию файла — claim_prefetched её дождётся."""
+    _transferring.add(key)
+    try:
+        yield
+    finally:
+        _transferring.discard(key)
+
+
+def is_claimed(key):
+    return key in _claimed
+
+
+async def claim_prefetched(key):
+    """
+    Забирает заранее скачанный файл.
+    Если предзагрузка уже качает файл — снимает с неё лимит скорости и дожидается;
+    если ещё ждёт своей очереди — отменяет её, и вызывающий качает сам на полной скорости.
+    Файл переходит вызывающему — удалить его должен он.
+    """
+    task = _prefetching.get(key)
+    if task is not None:
+        if key not in _transferring:
+            task.cancel()
+        else:
+            _claimed.add(key)
+            try:
+                # wait, а не await: отмена предзагрузки не должна отменять нас
+                await asyncio.wait({task})
+            finally:
+                _claimed.discard(key)
+    return prefetched_files.pop(key, notify=False)
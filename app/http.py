@@ -0,0 +1,95 @@
+"""
+Общий HTTP-клиент для всех запросов к SoundCloud / SkySound.
+Одна ClientSession на всё приложение: пул соединений, keep-alive и кэш DNS.
+"""
+import aiohttp
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+from config import proxy_url
+from app import metrics, ratelimit
+from app.settings import (
+    HTTP_LIMIT, HTTP_LIMIT_PER_HOST, HTTP_DNS_TTL, HTTP_KEEPALIVE,
+    HTTP_CONNECT_TIMEOUT, HTTP_TIMEOUT, UPSTREAM_MAX_RETRIES, UPSTREAM_MAX_RETRY_AFTER
+)
+
+HEADERS = {"User-Agent": "Mozilla/5.0"}
+
+_session = None
+
+
+async def init_http():
+    """Создаёт общую сессию (вызывается при старте бота)."""
+    global _session
+    if _session is not None and not _session.closed:
+        return _session
+
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_LIMIT,
+        limit_per_host=HTTP_LIMIT_PER_HOST,
+        ttl_dns_cache=HTTP_DNS_TTL,
+        keepalive_timeout=HTTP_KEEPALIVE,
+    )
+    _session = aiohttp.ClientSession(
+        connector=connector,
+        headers=HEADERS,
+        timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT, sock_connect=HTTP_CONNECT_TIMEOUT),
+    )
+    return _session
+
+
+async def close_http():
+    """Закрывает общую сессию (вызывается при остановке бота)."""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+async def get_session():
+    if _session is None or _session.closed:
+        return await init_http()
+    return _session
+
+
+@asynccontextmanager
+async def request(method, url, *, use_proxy=False, timeout=None, **kwargs):
+    """
+    Все запросы наружу идут через эту функцию.
+    use_proxy — пустить запрос через proxy_url из config.
+    timeout — общий таймаут в секундах.
+    Частота запросов к хосту ограничена (app/ratelimit.py); на 429/503 с Retry-After
+    запрос повторяется после паузы, если она не длиннее UPSTREAM_MAX_RETRY_AFTER.
+    """
+    session = await get_session()
+
+    if use_proxy and proxy_url:
+        kwargs["proxy"] = proxy_url
+    if timeout is not None:
+        kwargs["timeout"] = aiohttp.ClientTimeout(total=timeout)
+
+    host = urlsplit(url).hostname
+    for attempt in range(UPSTREAM_MAX_RETRIES + 1):
+        bucket = await ratelimit.acquire_upstream(host)
+        resp = await session.request(method, url, **kwargs)
+
+        delay = ratelimit.retry_after(resp.headers) if resp.status in (429, 503) else None
+        if delay is None or delay > UPSTREAM_MAX_RETRY_AFTER or attempt == UPSTREAM_MAX_RETRIES:
+            break
+
+        metrics.inc("ratelimit_retry_after_total", target=host)
+        resp.release()
+        bucket.pause(delay)
+
+    try:
+        yield resp
+    finally:
+        resp.release()
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def head(url, **kwargs):
+    return request("HEAD", url, **kwargs)
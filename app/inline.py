@@ -1,81 +1,91 @@
-import aiohttp
+import asyncio
+import logging
 import traceback
 from aiogram import Router
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import (
     InlineQuery, InlineQueryResultArticle,
-    FSInputFile,BufferedInputFile,
+    FSInputFile,
     InputTextMessageContent, InputMediaAudio,InlineKeyboardMarkup,
     InlineKeyboardButton, ChosenInlineResult
 )
-from config import bot
 
 from app.database.requests import (
-    search_soundcloud, search_skysound,
-    get_soundcloud_mp3_url, get_skysound_mp3,
-    rank_tracks_by_similarity
+    download_track, track_key, get_file_id, set_file_id, delete_file_id
+)
+from app.search import search_tracks, is_cached
+from app.sessions import set_inline_tracks, get_inline_tracks, get_inline_track, inline_result_id
+from app import metrics, prefetch
+from app.artwork import get_thumbnail
+from app.scheduler import downloads, SchedulerBusy
+from app.settings import (
+    INLINE_SEARCH_DEADLINE, INLINE_PAGE_SIZE, INLINE_CACHE_TIME, INLINE_IS_PERSONAL,
+    INLINE_DEBOUNCE, INLINE_DEBOUNCE_SHORT, INLINE_SHORT_QUERY
 )
 
 router = Router()
-TRACKS = {}
-
-
-async def resolve_mp3_url(track):
-    if track["source"] == "SoundCloud":
-        return await get_soundcloud_mp3_url(track["url"])
-
-    if track["source"] == "SkySound":
-        return await get_skysound_mp3(track["url"])
+logger = logging.getLogger(__name__)
+_searches = {}   # user_id -> задача текущего inline-поиска
 
-    return None
 
+async def _debounced_search(query: str):
+    """Ждём, пока пользователь перестанет печатать, и только потом ищем."""
+    if not is_cached(query):
+        short = len(query) < INLINE_SHORT_QUERY
+        await asyncio.sleep(INLINE_DEBOUNCE_SHORT if short else INLINE_DEBOUNCE)
 
-
-async def probe_url(session, url, timeout=10):
-    """HEAD + small GET probe; возвращает dict с info"""
-    info = {"url": url, "head": None, "head_status": None, "content_type": None,
-            "content_length": None, "get_status": None, "sample_bytes": None,
-            "error": None}
-    try:
-        async with session.head(url, timeout=timeout, allow_redirects=True) as r:
-            info["head_status"] = r.status
-            info["head"] = dict(r.headers)
-            info["content_type"] = r.headers.get("Content-Type")
-            info["content_length"] = r.headers.get("Content-Length")
-    except Exception as e_head:
-        info["error"] = f"HEAD failed: {repr(e_head)}"
-        # попробуем GET anyway
-    # если HEAD прошёл и явно запрещает (например 403) — вернём
-    try:
-        # небольшой GET фрагмента (Range) — некоторые сервера не поддерживают, но пробуем
-        headers = {"Range": "bytes=0-1023"}
-        async with session.get(url, headers=headers, timeout=timeout, allow_redirects=True) as r2:
-            info["get_status"] = r2.status
-            info["get_headers"] = dict(r2.headers)
-            chunk = await r2.content.read(1024)
-            info["sample_bytes"] = len(chunk)
-    except Exception as e_get:
-        if info.get("error"):
-            info["error"] += " | " + repr(e_get)
-        else:
-            info["error"] = f"GET failed: {repr(e_get)}"
-    return info
+    # inline-ответ должен уложиться в окно Telegram — ждём только быстрые источники
+    tracks, _ = await search_tracks(query, deadline=INLINE_SEARCH_DEADLINE)
+    return tracks
 
 
 @router.inline_query()
 async def inline_search(q: InlineQuery):
     query = q.query.strip()
-    if not query:
-        return await q.answer([])
+    user_id = q.from_user.id
 
-    tracks = []
-    tracks += await search_skysound(query)
-    tracks += await search_soundcloud(query)
-    tracks = rank_tracks_by_similarity(query, tracks)
+    if q.offset:
+        # следующая страница: режем ту же выдачу, что показали на первой (offset = "set_id:позиция"),
+        # а не ищем заново — новый поиск мог бы дать другой порядок
+        try:
+            set_id, offset = map(int, q.offset.split(":"))
+        except ValueError:
+            set_id, offset = None, 0
+        tracks = await get_inline_tracks(user_id, set_id) if set_id is not None else None
+        if tracks is None:
+            # выдача истекла — страниц больше нет
+            return await q.answer([], cache_time=INLINE_CACHE_TIME, is_personal=INLINE_IS_PERSONAL)
+    else:
+        offset = 0
+        # новый текст запроса — прошлый поиск этого пользователя больше не нужен
+        previous = _searches.pop(user_id, None)
+        if previous is not None:
+            previous.cancel()
+        prefetch.cancel(user_id)
+
+        if not query:
+            return await q.answer([], cache_time=INLINE_CACHE_TIME, is_personal=INLINE_IS_PERSONAL)
+
+        task = asyncio.create_task(_debounced_search(query))
+        _searches[user_id] = task
+        try:
+            await asyncio.wait({task})
+        finally:
+            if _searches.get(user_id) is task:
+                del _searches[user_id]
+
+        if task.cancelled():
+            return   # пользователь уже набрал другой запрос
+        tracks = task.result()
+        set_id = await set_inline_tracks(user_id, tracks)
+
+    page = tracks[offset:offset + INLINE_PAGE_SIZE]
+    end = offset + INLINE_PAGE_SIZE
+    next_offset = f"{set_id}:{end}" if end < len(tracks) else ""
 
     results = []
-    for i, t in enumerate(tracks[:18]):
-        tid = f"{q.from_user.id}:{i}"
-        TRACKS[tid] = t
+    for i, t in enumerate(page, start=offset):
+        tid = inline_result_id(user_id, set_id, i)
 
         results.append(
             InlineQueryResultArticle(
@@ -94,100 +104,131 @@ async def inline_search(q: InlineQuery):
             )
         )
 
-    await q.answer(results, cache_time=0)
+    await q.answer(
+        results,
+        cache_time=INLINE_CACHE_TIME,
+        is_personal=INLINE_IS_PERSONAL,
+        next_offset=next_offset
+    )
+    if not offset:
+        prefetch.schedule(user_id, page)
 
 
 @router.chosen_inline_result()
 async def diagnostic_chosen(result: ChosenInlineResult):
-    print("\n===== CHOSEN_INLINE_RESULT (download → upload → edit WITH THUMB) =====")
-
+    bot = result.bot
     tid = result.result_id
-    track = TRACKS.get(tid)
+    track = await get_inline_track(tid)
     inline_id = result.inline_message_id
     user_id = result.from_user.id
 
     if not track:
-        print("❌ Track not found")
-        return
-
-    print("✔ Track:", track)
-
-    # ==== 1. Получаем прямой mp3 URL ====
-    try:
-        if track.get("source") == "SoundCloud":
-            mp3_url = await get_soundcloud_mp3_url(track["url"])
-        else:
-            mp3_url = await get_skysound_mp3(track["url"])
-    except Exception as e:
-        print("❌ mp3 resolve error:", e)
-        return
-
-    if not mp3_url:
-        await bot.edit_message_text(
-            inline_message_id=inline_id,
-            text="❌ Не удалось получить mp3 URL"
-        )
+        # ответ из кэша Telegram (INLINE_CACHE_TIME) мог пережить выдачу или перезапуск бота
+        logger.warning("Inline: трек %s не найден", tid)
+        try:
+            await bot.edit_message_text(
+                inline_message_id=inline_id,
+                text="⚠️ Результат устарел — повтори поиск"
+            )
+        except Exception as e:
+            logger.warning("Inline: не удалось обновить сообщение: %s", e)
         return
 
-    print("✔ Resolved mp3:", mp3_url)
+    key = track_key(track)
+    logger.debug("Inline: выбран %s", key)
 
-    # ==== 2. Скачиваем аудио ====
-    import aiohttp
-    async with aiohttp.ClientSession() as session:
+    # ==== 0. Трек уже есть в Telegram — сразу подставляем file_id ====
+    file_id = await get_file_id(key)
+    metrics.inc("file_id_cache_total", result="hit" if file_id else "miss")
+    if file_id:
         try:
-            async with session.get(mp3_url) as r:
-                if r.status != 200:
-                    raise Exception(f"GET {r.status}")
-                data = await r.read()
-        except Exception as e:
-            print("❌ Download failed:", e)
-            await bot.edit_message_text(
+            await bot.edit_message_media(
                 inline_message_id=inline_id,
-                text="❌ Ошибка скачивания файла"
+                media=InputMediaAudio(
+                    media=file_id,
+                    title=track["title"],
+                    performer=track["artist"],
+                )
             )
             return
+        except TelegramBadRequest as e:
+            if "not modified" in str(e):
+                return   # повторный выбор: в сообщении уже это аудио
+            metrics.inc("file_id_cache_total", result="stale")
+            logger.warning("file_id из кэша не подошёл, загружаем заново: %s", e)
+            await delete_file_id(key)
+        except Exception as e:
+            # сеть, лимиты Telegram — file_id тут ни при чём, перезаливать бесполезно
+            logger.warning("Inline: не удалось подставить аудио: %s", e)
+            return
 
-    print(f"✔ Downloaded {len(data)} bytes")
+    async def deliver():
+        """Скачать и загрузить в личку пользователю; результат — file_id."""
 
-    # ==== 3. Загружаем thumbnail ====
-    try:
-        with open("tttumb.jpg", "rb") as f:
-            thumb_data = f.read()
-        thumb = BufferedInputFile(thumb_data, filename="thumb.jpg")
-    except Exception as e:
-        print("❌ Thumbnail load failed:", e)
-        thumb = None
+        # ==== 1. Обложка: своя у трека или общая (из кэша) ====
+        thumb = await get_thumbnail(track)
 
-    # ==== 4. Загружаем пользователю в личку ====
-    audio_file = BufferedInputFile(
-        data,
-        filename=f"{track['artist']} - {track['title']}.mp3"
-    )
+        # ==== 2. Берём mp3 из локального кэша или качаем ====
+        async with download_track(track) as path:
+            if not path:
+                return None
+
+            # ==== 3-4. Загружаем пользователю в личку прямо из файла ====
+            audio_file = FSInputFile(
+                path,
+                filename=f"{track['artist']} - {track['title']}.mp3"
+            )
+
+            with metrics.timer("telegram_upload_seconds", mode="inline"):
+                sent = await bot.send_audio(
+                    chat_id=user_id,
+                    audio=audio_file,
+                    title=track["title"],
+                    performer=track["artist"],
+                    thumbnail=thumb  # ⭐ ВАЖНО: обложка здесь
+                )
+            file_id = sent.audio.file_id
+            await set_file_id(key, file_id)
+
+        # ==== 5. Удаляем сообщение в личке ====
+        try:
+            await bot.delete_message(chat_id=user_id, message_id=sent.message_id)
+        except Exception as e:
+            logger.warning("Не удалось удалить личное сообщение: %s", e)
 
+        return file_id
+
+    # ==== Ставим в очередь (тот же трек уже качается — ждём его) ====
     try:
-        sent = await bot.send_audio(
-            chat_id=user_id,
-            audio=audio_file,
-            title=track["title"],
-            performer=track["artist"],
-            thumbnail=thumb  # ⭐ ВАЖНО: обложка здесь
+        job = downloads.submit(key, track["source"], deliver)
+        if job.position:
+            await bot.edit_message_text(
+                inline_message_id=inline_id,
+                text=f"⏳ Очередь загрузки: {job.position}"
+            )
+        file_id = await downloads.wait(job, deliver)
+
+    except SchedulerBusy:
+        await bot.edit_message_text(
+            inline_message_id=inline_id,
+            text="⚠ Слишком много загрузок, попробуй через минуту"
         )
-        file_id = sent.audio.file_id
-        print("✔ Uploaded OK. file_id:", file_id)
+        return
 
     except Exception as e:
-        print("❌ Upload failed:", e)
+        logger.exception("Inline: загрузка не удалась: %s", e)
         await bot.edit_message_text(
             inline_message_id=inline_id,
             text="❌ Ошибка отправки файла"
         )
         return
 
-    # ==== 5. Удаляем сообщение в личке ====
-    try:
-        await bot.delete_message(chat_id=user_id, message_id=sent.message_id)
-    except Exception as e:
-        print("⚠ Не удалось удалить личное сообщение:", e)
+    if not file_id:
+        await bot.edit_message_text(
+            inline_message_id=inline_id,
+            text="❌ Ошибка скачивания файла"
+        )
+        return
 
     # ==== 6. Редактируем inline, подставляя загруженный file_id ====
     try:
@@ -200,13 +241,11 @@ async def diagnostic_chosen(result: ChosenInlineResult):
                 # thumbnail сюда ставить нельзя — Telegram игнорирует
             )
         )
-        print("✔ Inline edited successfully")
     except Exception as e:
-        print("❌ Inline edit failed:", e)
+        logger.warning("Inline: не удалось отредактировать сообщение: %s", e)
         await bot.edit_message_text(
             inline_message_id=inline_id,
             text=f"⚠ Ошибка редактирования. file_id: {file_id}"
         )
 
-    print("===== END =====\n")
 
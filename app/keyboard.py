@@ -6,10 +6,13 @@ TRACKS_PER_PAGE = 10
 MAX_TRACKS = 40
 
 
-def build_tracks_keyboard(tracks: list, page: int = 1) -> InlineKeyboardBuilder:
+def build_tracks_keyboard(tracks: list, page: int = 1, version: int = None) -> InlineKeyboardBuilder:
     """
     Создаёт инлайн-клавиатуру с треками, разбивая их на страницы.
+    version — версия выдачи (sessions.set_chat_tracks), дописывается в callback_data,
+    чтобы нажатие на устаревшую клавиатуру не попало в другой трек.
     """
+    suffix = f"_{version}" if version is not None else ""
     builder = InlineKeyboardBuilder()
     tracks = tracks[:MAX_TRACKS]
 
@@ -30,7 +33,7 @@ def build_tracks_keyboard(tracks: list, page: int = 1) -> InlineKeyboardBuilder:
 
         builder.button(
             text=formatted_text,  # ПОЛНЫЙ текст с переносами
-            callback_data=f"play_{i}"
+            callback_data=f"play_{i}{suffix}"
         )
 
     builder.adjust(1)
@@ -40,7 +43,7 @@ def build_tracks_keyboard(tracks: list, page: int = 1) -> InlineKeyboardBuilder:
 
         if page > 1:
             nav_buttons.append(
-                InlineKeyboardButton(text="<-", callback_data=f"page_{page - 1}")
+                InlineKeyboardButton(text="<-", callback_data=f"page_{page - 1}{suffix}")
             )
 
         nav_buttons.append(
@@ -49,7 +52,7 @@ def build_tracks_keyboard(tracks: list, page: int = 1) -> InlineKeyboardBuilder:
 
         if page < total_pages:
             nav_buttons.append(
-                InlineKeyboardButton(text="->", callback_data=f"page_{page + 1}")
+                InlineKeyboardButton(text="->", callback_data=f"page_{page + 1}{suffix}")
             )
 
         builder.row(*nav_buttons)
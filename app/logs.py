@@ -0,0 +1,37 @@
+"""
+Настройка логов: уровень из LOG_LEVEL, запись в stdout — в отдельном потоке.
+Хендлеры вызывают только QueueHandler (положить запись в очередь),
+так что медленный терминал или pipe не тормозят event loop.
+"""
+import logging
+import logging.handlers
+import queue
+
+from app.settings import LOG_LEVEL
+
+_listener = None
+
+
+def setup_logging(level=LOG_LEVEL):
+    global _listener
+    if _listener is not None:
+        return
+
+    records = queue.SimpleQueue()
+    stream = logging.StreamHandler()
+    stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    root = logging.getLogger()
+    root.handlers[:] = [logging.handlers.QueueHandler(records)]
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(records, stream, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging():
+    """Дописывает очередь и останавливает поток записи."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,224 @@
+"""
+Метрики в памяти: счётчики и гистограммы с фиксированными корзинами.
+Пишутся с горячего пути (observe/inc — пара операций со словарём),
+читаются админ-командой /stats и HTTP-эндпоинтом в формате Prometheus.
+
+    metrics.observe("search_provider_seconds", 0.8, provider="SkySound", status="ok")
+    with metrics.timer("rank_seconds"):
+        ...
+    metrics.inc("file_id_cache_total", result="hit")
+"""
+import bisect
+import logging
+import time
+from contextlib import contextmanager
+
+from aiohttp import web
+
+from app.settings import METRICS_HOST, METRICS_PORT
+
+logger = logging.getLogger(__name__)
+
+# верхние границы корзин; последняя — +Inf
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTE_BUCKETS = (16_384, 65_536, 262_144, 1_048_576, 4_194_304, 8_388_608,
+                16_777_216, 33_554_432, 52_428_800)
+
+HELP = {
+    "search_provider_seconds": "Время ответа провайдера поиска",
+    "rank_seconds": "Время дедупа и ранжирования выдачи",
+    "resolve_seconds": "Время получения прямой mp3-ссылки (без кэша)",
+    "download_seconds": "Время скачивания файла",
+    "download_bytes": "Размер скачанного файла",
+    "download_errors_total": "Неудачные скачивания",
+    "download_rejected_total": "Ответы, отсечённые проверкой mp3 до скачивания",
+    "telegram_upload_seconds": "Время загрузки аудио в Telegram",
+    "file_id_cache_total": "Обращения к кэшу file_id",
+    "audio_cache_total": "Обращения к локальному кэшу mp3",
+    "audio_cache_evicted_total": "Файлы, вытесненные из локального кэша mp3",
+    "ratelimit_wait_seconds": "Ожидание в очереди лимита частоты",
+    "ratelimit_retry_after_total": "Ответы 429/Retry-After, после которых запрос повторён",
+    "breaker_open_total": "Сколько раз источник выключался breaker'ом",
+    "breaker_rejected_total": "Запросы, не отправленные из-за выключенного источника",
+    "hedge_total": "Отправленные дублирующие запросы",
+    "hedge_won_total": "Дублирующие запросы, ответившие раньше первого",
+}
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Оценка квантиля по корзинам (верхняя граница корзины)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+_counters = {}     # (name, labels) -> число
+_histograms = {}   # (name, labels) -> Histogram
+_caches = {}       # имя -> TTLCache, статистику берём при выводе
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    key = (name, _labels(labels))
+    _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    key = (name, _labels(labels))
+    hist = _histograms.get(key)
+    if hist is None:
+        hist = _histograms[key] = Histogram(
+            BYTE_BUCKETS if name.endswith("_bytes") else TIME_BUCKETS
+        )
+    hist.observe(value)
+
+
+@contextmanager
+def timer(name, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def register_cache(name, cache):
+    """TTLCache, чьи hits/misses/evictions попадут в вывод."""
+    _caches[name] = cache
+
+
+def reset():
+    _counters.clear()
+    _histograms.clear()
+
+
+# --- Вывод ---
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+def render_prometheus() -> str:
+    lines = []
+    typed = set()
+
+    def header(name, kind):
+        if name not in typed:
+            typed.add(name)
+            if name in HELP:
+                lines.append(f"# HELP {name} {HELP[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), value in sorted(_counters.items()):
+        header(name, "counter")
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    for (name, labels), hist in sorted(_histograms.items(), key=lambda item: item[0]):
+        header(name, "histogram")
+        cumulative = 0
+        for bound, n in zip(hist.buckets, hist.counts):
+            cumulative += n
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {hist.count}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {hist.sum}")
+        lines.append(f"{name}_count{_format_labels(labels)} {hist.count}")
+
+    for cache_name, cache in sorted(_caches.items()):
+        stats = cache.stats()
+        for field, kind in (("hits", "counter"), ("misses", "counter"),
+                            ("evictions", "counter"), ("entries", "gauge"), ("bytes", "gauge")):
+            name = f"cache_{field}" + ("_total" if kind == "counter" else "")
+            header(name, kind)
+            lines.append(f'{name}{{cache="{cache_name}"}} {stats[field]}')
+
+    return "\n".join(lines) + "\n"
+
+
+def summary() -> str:
+    """Короткая сводка для админа: по гистограммам n / среднее / p50 / p95, по кэшам hit rate."""
+    lines = []
+    for (name, labels), hist in sorted(_histograms.items(), key=lambda item: item[0]):
+        label = ",".join(str(v) for _, v in labels)
+        title = f"{name}[{label}]" if label else name
+        if not hist.count:
+            continue
+        avg = hist.sum / hist.count
+        if name.endswith("_bytes"):
+            lines.append(f"{title}: n={hist.count} avg={avg / 1024:.0f}KB "
+                         f"p95≤{hist.quantile(0.95) / 1024:.0f}KB")
+        else:
+            lines.append(f"{title}: n={hist.count} avg={avg:.3f}s "
+                         f"p50≤{hist.quantile(0.5)}s p95≤{hist.quantile(0.95)}s")
+
+    for (name, labels), value in sorted(_counters.items()):
+        label = ",".join(str(v) for _, v in labels)
+        lines.append(f"{name}[{label}]: {value}" if label else f"{name}: {value}")
+
+    for cache_name, cache in sorted(_caches.items()):
+        stats = cache.stats()
+        lines.append(f"cache {cache_name}: {stats['entries']} шт, {stats['bytes'] // 1024}KB, "
+                     f"hit rate {stats['hit_rate']:.0%}, вытеснено {stats['evictions']}")
+
+    return "\n".join(lines)
+
+
+# --- HTTP-эндпоинт ---
+
+_runner = None
+
+
+async def _handle(request):
+    return web.Response(text=render_prometheus(), content_type="text/plain", charset="utf-8")
+
+
+async def start_server(host=METRICS_HOST, port=METRICS_PORT):
+    """Поднимает /metrics на host:port (port=None — не поднимать)."""
+    global _runner
+    if port is None or _runner is not None:
+        return
+    app = web.Application()
+    app.router.add_get("/metrics", _handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError as e:
+        # порт уже занят, например соседним процессом-воркером — бот работает и без /metrics
+        logger.warning("Метрики не подняты на %s:%s: %s", host, port, e)
+        await runner.cleanup()
+        return
+    _runner = runner
+    logger.info("Метрики: http://%s:%s/metrics", host, port)
+
+
+async def stop_server():
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
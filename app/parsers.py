@@ -0,0 +1,139 @@
+"""
+Разбор страницы артиста SkySound (div.playlist-item) в список треков.
+Два бэкенда с одинаковым результатом: lxml (быстрый, по умолчанию) и BeautifulSoup.
+Большие страницы разбираются в отдельном потоке, чтобы не блокировать event loop.
+"""
+import asyncio
+import re
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+from lxml import etree, html as lxml_html
+
+from app.settings import SKYSOUND_PARSER, SKYSOUND_EXECUTOR_BYTES, SKYSOUND_ARTIST_URL
+
+_JUNK_WORDS = re.compile(r"\b(скачать|download|слушать)\b", flags=re.I)
+
+
+def skysound_artist_url(artist_domain: str) -> str:
+    return SKYSOUND_ARTIST_URL.format(artist=artist_domain)
+
+
+def _make_track(href, title_raw, duration, thumb, artist_domain):
+    if not href.startswith("http"):
+        href = urljoin(skysound_artist_url(artist_domain), href)
+
+    # название
+    title_raw = _JUNK_WORDS.sub("", title_raw)
+    title_raw = title_raw.strip(" -–—")
+
+    if " - " in title_raw:
+        artist, title = title_raw.split(" - ", 1)
+    else:
+        artist = "Неизвестен"
+        title = title_raw or "Без названия"
+
+    return {
+        "title": title,
+        "artist": artist,
+        "url": href,
+        "duration": duration,
+        "thumb": thumb,
+        "source": "SkySound"
+    }
+
+
+def _unique(tracks):
+    seen = set()
+    result = []
+    for track in tracks:
+        if track["url"] in seen:
+            continue
+        seen.add(track["url"])
+        result.append(track)
+    return result
+
+
+# --- BeautifulSoup ---
+
+def parse_skysound_bs4(html: str, artist_domain: str):
+    soup = BeautifulSoup(html, "html.parser")
+    tracks = []
+
+    for item in soup.select("div.playlist-item"):
+        link = item.find("a", href=True)
+        if not link:
+            continue
+
+        title_raw = (link.get("title") or link.text or "").strip()
+
+        duration = "?:??"
+        dur = item.select_one("div.playlist-right span.playlist-duration")
+        if dur:
+            duration = dur.text.strip()
+
+        img = item.select_one(".playlist-left img")
+        thumb = img["src"] if img and img.get("src") else None
+
+        tracks.append(_make_track(link["href"].strip(), title_raw, duration, thumb, artist_domain))
+
+    return _unique(tracks)
+
+
+# --- lxml ---
+
+def _class(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+_ITEMS = etree.XPath(f"//div[{_class('playlist-item')}]")
+_LINK = etree.XPath(".//a[@href]")
+_DURATION = etree.XPath(f".//div[{_class('playlist-right')}]//span[{_class('playlist-duration')}]")
+_IMG = etree.XPath(f".//*[{_class('playlist-left')}]//img")
+
+
+def parse_skysound_lxml(html: str, artist_domain: str):
+    try:
+        doc = lxml_html.document_fromstring(html)
+    except (ValueError, etree.ParserError):
+        # например, строка с <?xml encoding=...?> или пустая страница
+        return parse_skysound_bs4(html, artist_domain)
+
+    tracks = []
+
+    for item in _ITEMS(doc):
+        links = _LINK(item)
+        if not links:
+            continue
+        link = links[0]
+
+        title_raw = (link.get("title") or link.text_content() or "").strip()
+
+        duration = "?:??"
+        dur = _DURATION(item)
+        if dur:
+            duration = dur[0].text_content().strip()
+
+        img = _IMG(item)
+        thumb = img[0].get("src") if img and img[0].get("src") else None
+
+        tracks.append(_make_track(link.get("href").strip(), title_raw, duration, thumb, artist_domain))
+
+    return _unique(tracks)
+
+
+PARSERS = {
+    "lxml": parse_skysound_lxml,
+    "bs4": parse_skysound_bs4,
+}
+
+
+async def parse_skysound_page(html: str, artist_domain: str, backend: str = SKYSOUND_PARSER):
+    """Разбирает страницу выбранным бэкендом; тяжёлые страницы — в executor."""
+    parse = PARSERS[backend]
+
+    if len(html) < SKYSOUND_EXECUTOR_BYTES:
+        return parse(html, artist_domain)
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, parse, html, artist_domain)
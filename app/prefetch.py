@@ -0,0 +1,120 @@
+"""
+Предзагрузка первых треков выдачи, пока пользователь читает список.
+Получаем прямые ссылки (и, если PREFETCH_DOWNLOAD, сами файлы) для PREFETCH_TOP_N треков,
+чтобы нажатие на первый результат отдавало аудио быстрее.
+Новый поиск пользователя отменяет его незаконченную предзагрузку.
+"""
+import asyncio
+import logging
+import os
+import time
+
+from app import audio_cache
+from app.database.requests import resolve_mp3_url, track_key, track_headers, get_file_id
+from app.download import (
+    download_to_file, prefetched_files, add_prefetching, prefetch_transfer, is_claimed,
+    PREFETCH_DIR, DownloadError
+)
+from app.settings import (
+    PREFETCH_ENABLED, PREFETCH_TOP_N, PREFETCH_DOWNLOAD, PREFETCH_CONCURRENCY, PREFETCH_BANDWIDTH,
+    AUDIO_CACHE_ENABLED
+)
+
+logger = logging.getLogger(__name__)
+
+_tasks = {}   # user_id -> задача предзагрузки
+_semaphore = asyncio.Semaphore(PREFETCH_CONCURRENCY)
+
+
+class _Bandwidth:
+    """Общий лимит скорости для всех предзагрузок (байт/сек)."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._free_at = 0.0
+
+    async def __call__(self, nbytes):
+        if not self.rate:
+            return
+        now = time.monotonic()
+        start = max(self._free_at, now)
+        self._free_at = start + nbytes / self.rate
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+_bandwidth = _Bandwidth(PREFETCH_BANDWIDTH)
+
+
+def schedule(user_id, tracks):
+    """Запускает предзагрузку топа выдачи, отменяя прошлую для этого пользователя."""
+    cancel(user_id)
+    if not PREFETCH_ENABLED or not tracks:
+        return
+
+    task = asyncio.create_task(_prefetch(tracks[:PREFETCH_TOP_N]))
+    _tasks[user_id] = task
+    task.add_done_callback(lambda t: _forget(user_id, t))
+
+
+def _forget(user_id, task):
+    if _tasks.get(user_id) is task:
+        del _tasks[user_id]
+
+
+def cancel(user_id):
+    task = _tasks.pop(user_id, None)
+    if task is not None:
+        task.cancel()
+
+
+async def _prefetch(tracks):
+    jobs = []
+    for track in tracks:
+        job = asyncio.create_task(_prefetch_track(track))
+        if PREFETCH_DOWNLOAD:
+            # download_track дождётся этой задачи, а не начнёт качать параллельно
+            add_prefetching(track_key(track), job)
+        jobs.append(job)
+
+    try:
+        await asyncio.gather(*jobs, return_exceptions=True)
+    finally:
+        for job in jobs:
+            job.cancel()
+
+
+async def _prefetch_track(track):
+    key = track_key(track)
+
+    # уже лежит в Telegram, уже скачан или есть в локальном кэше mp3 — готовить нечего
+    if key in prefetched_files or await get_file_id(key):
+        return
+    if AUDIO_CACHE_ENABLED and await audio_cache.contains([key]):
+        return
+
+    async with _semaphore:
+        mp3_url = await resolve_mp3_url(track)
+        if not mp3_url or not PREFETCH_DOWNLOAD:
+            return
+
+        await _download(key, track, mp3_url)
+
+
+async def _download(key, track, mp3_url):
+    os.makedirs(PREFETCH_DIR, exist_ok=True)
+
+    async def throttle(nbytes):
+        # трек уже ждёт пользователь — докачиваем без общего лимита
+        if not is_claimed(key):
+            await _bandwidth(nbytes)
+
+    try:
+        with prefetch_transfer(key):
+            async with download_to_file(mp3_url, headers=track_headers(track), throttle=throttle) as path:
+                target = os.path.join(PREFETCH_DIR, os.path.basename(path))
+                os.replace(path, target)
+        prefetched_files.set(key, target)
+        logger.debug("Предзагружен: %s - %s", track["artist"], track["title"])
+    except DownloadError as e:
+        logger.warning("Предзагрузка не удалась: %s", e)
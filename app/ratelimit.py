@@ -0,0 +1,165 @@
+"""
+Ограничение частоты исходящих запросов: token bucket на каждое направление.
+- Telegram: общий лимит бота и лимит на чат (TelegramRateLimit — middleware сессии aiogram).
+  На 429 ставим направление на паузу retry_after и повторяем запрос.
+- Источники: лимит на хост из UPSTREAM_RATE_LIMITS (см. app/http.py), пауза по Retry-After.
+Запросы сверх лимита ждут своей очереди (FIFO), а не отбрасываются.
+Время ожидания пишется в метрику ratelimit_wait_seconds.
+"""
+import asyncio
+import logging
+import time
+from email.utils import parsedate_to_datetime
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+from app import metrics
+from app.cache import TTLCache
+from app.settings import (
+    TELEGRAM_RATE, TELEGRAM_BURST, TELEGRAM_CHAT_RATE, TELEGRAM_CHAT_BURST, TELEGRAM_MAX_RETRIES,
+    UPSTREAM_RATE_LIMITS
+)
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """rate токенов в секунду, не больше burst в запасе; rate=None — без лимита (только паузы)."""
+
+    def __init__(self, rate=None, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1, rate or 1)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        """Никого не пускать ближайшие seconds (retry_after / Retry-After)."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        """Ждёт токен; возвращает, сколько секунд пришлось ждать."""
+        start = time.monotonic()
+        if self.rate is None and start >= self.blocked_until and not self._lock.locked():
+            return 0.0
+
+        # Lock честный (FIFO): кто раньше встал в очередь, тот раньше и пройдёт
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                if self.rate is None:
+                    break
+
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    break
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+        return time.monotonic() - start
+
+
+async def _acquire(bucket, name):
+    waited = await bucket.acquire()
+    # у хостов без лимита пишем только реальные ожидания (после Retry-After)
+    if waited or bucket.rate is not None:
+        metrics.observe("ratelimit_wait_seconds", waited, bucket=name)
+
+
+# --- Telegram ---
+
+# методы, которые Telegram ограничивает по частоте: отправка и правка сообщений
+_LIMITED_PREFIXES = ("send", "edit", "copy", "forward")
+
+
+class TelegramRateLimit(BaseRequestMiddleware):
+    def __init__(self, rate=TELEGRAM_RATE, burst=TELEGRAM_BURST,
+                 chat_rate=TELEGRAM_CHAT_RATE, chat_burst=TELEGRAM_CHAT_BURST,
+                 max_retries=TELEGRAM_MAX_RETRIES):
+        self.bucket = TokenBucket(rate, burst)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._chats = TTLCache(max_entries=50_000, ttl=600)
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chats.set(chat_id, bucket)
+        return bucket
+
+    def _buckets(self, method):
+        if not method.__api_method__.startswith(_LIMITED_PREFIXES):
+            return []
+        buckets = [("telegram", self.bucket)]
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is not None:
+            buckets.append(("telegram_chat", self._chat_bucket(chat_id)))
+        return buckets
+
+    async def __call__(self, make_request, bot, method):
+        buckets = self._buckets(method)
+
+        for attempt in range(self.max_retries + 1):
+            for name, bucket in buckets:
+                await _acquire(bucket, name)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                metrics.inc("ratelimit_retry_after_total", target="telegram")
+                if attempt == self.max_retries:
+                    raise
+                logger.warning("Telegram 429 на %s: ждём %s с", method.__api_method__, e.retry_after)
+                if buckets:
+                    # флуд в конкретный чат — пауза этого чата, иначе всего бота
+                    buckets[-1][1].pause(e.retry_after)
+                else:
+                    await asyncio.sleep(e.retry_after)
+
+
+# --- Источники ---
+
+_upstream = {rule: TokenBucket(*limit) for rule, limit in UPSTREAM_RATE_LIMITS.items()}
+_hosts = TTLCache(max_entries=1000, ttl=3600)   # хосты без лимита — только для пауз по Retry-After
+
+
+def upstream_bucket(host):
+    """(имя, bucket) для хоста: правило из UPSTREAM_RATE_LIMITS по домену или свой bucket без лимита."""
+    host = (host or "").lower()
+    for rule, bucket in _upstream.items():
+        if host == rule or host.endswith("." + rule):
+            return rule, bucket
+
+    bucket = _hosts.get(host)
+    if bucket is None:
+        bucket = TokenBucket()
+        _hosts.set(host, bucket)
+    return host, bucket
+
+
+async def acquire_upstream(host):
+    name, bucket = upstream_bucket(host)
+    await _acquire(bucket, name)
+    return bucket
+
+
+def retry_after(headers):
+    """Retry-After в секундах (число или HTTP-дата); None, если заголовка нет."""
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
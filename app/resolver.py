@@ -0,0 +1,96 @@
+"""
+Кэш прямых mp3-ссылок перед get_soundcloud_mp3_url / get_skysound_mp3.
+Срок жизни берётся из подписи ссылки (Expires, Policy, X-Amz-*), иначе RESOLVE_CACHE_TTL.
+Одновременные запросы одного трека склеиваются в один.
+"""
+import asyncio
+import base64
+import json
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, parse_qs
+
+from app import metrics
+from app.cache import TTLCache
+from app.settings import RESOLVE_CACHE_TTL, RESOLVE_CACHE_ENTRIES, RESOLVE_EXPIRY_MARGIN
+
+
+resolve_cache = TTLCache(max_entries=RESOLVE_CACHE_ENTRIES, ttl=RESOLVE_CACHE_TTL)
+metrics.register_cache("resolve", resolve_cache)
+_in_flight = {}
+
+
+def _policy_expiry(policy):
+    # CloudFront: base64 с заменой символов + -> -, = -> _, / -> ~
+    raw = policy.replace("-", "+").replace("_", "=").replace("~", "/")
+    data = json.loads(base64.b64decode(raw))
+    for statement in data.get("Statement", []):
+        epoch = statement.get("Condition", {}).get("DateLessThan", {}).get("AWS:EpochTime")
+        if epoch:
+            return int(epoch)
+    return None
+
+
+def url_expiry(url):
+    """Unix-время, до которого подписанная ссылка действительна (или None)."""
+    params = {k.lower(): v[0] for k, v in parse_qs(urlsplit(url).query).items()}
+
+    try:
+        if "policy" in params:
+            expiry = _policy_expiry(params["policy"])
+            if expiry:
+                return expiry
+
+        for name in ("expires", "exp", "e"):
+            if name in params and params[name].isdigit():
+                return int(params[name])
+
+        if "x-amz-date" in params and "x-amz-expires" in params:
+            signed = datetime.strptime(params["x-amz-date"], "%Y%m%dT%H%M%SZ")
+            signed = signed.replace(tzinfo=timezone.utc)
+            return int(signed.timestamp()) + int(params["x-amz-expires"])
+    except Exception:
+        return None
+
+    return None
+
+
+def url_ttl(url):
+    """Сколько секунд можно держать ссылку в кэше."""
+    expiry = url_expiry(url)
+    if expiry is None:
+        return RESOLVE_CACHE_TTL
+    return max(0, expiry - time.time() - RESOLVE_EXPIRY_MARGIN)
+
+
+async def resolve(key, factory):
+    """
+    Отдаёт ссылку из кэша либо вызывает factory() (корутина, возвращающая url или None).
+    Пока идёт запрос по key, остальные ждут его результат.
+    """
+    url = resolve_cache.get(key)
+    if url:
+        return url
+
+    task = _in_flight.get(key)
+    if task is None:
+        task = asyncio.create_task(_resolve(key, factory))
+        _in_flight[key] = task
+        task.add_done_callback(lambda _: _in_flight.pop(key, None))
+
+    # shield: отмена одного ожидающего не должна отменять общий запрос
+    return await asyncio.shield(task)
+
+
+async def _resolve(key, factory):
+    with metrics.timer("resolve_seconds", source=key.split(":", 1)[0]):
+        url = await factory()
+    if url:
+        ttl = url_ttl(url)
+        if ttl > 0:
+            resolve_cache.set(key, url, ttl=ttl)
+    return url
+
+
+def invalidate(key):
+    resolve_cache.pop(key)
@@ -0,0 +1,152 @@
+"""
+Очередь загрузок: ограниченная очередь и свой пул воркеров на каждый источник.
+Одинаковые задания (один track_key) склеиваются: первый качает и загружает,
+остальные ждут его результат (file_id). Если задание первого упало, каждый
+ожидающий один раз выполняет своё: ошибка могла касаться только первого
+(например, Forbidden при отправке в личку пользователю, не запускавшему бота).
+"""
+import asyncio
+
+from app.settings import DOWNLOAD_WORKERS, DOWNLOAD_DEFAULT_WORKERS, DOWNLOAD_QUEUE_SIZE
+
+
+class SchedulerBusy(Exception):
+    """Очередь источника переполнена."""
+
+
+class Job:
+    def __init__(self, pool, key, factory, seq):
+        self.pool = pool
+        self.key = key
+        self.factory = factory
+        self.seq = seq
+        self.running = False
+        self.future = asyncio.get_running_loop().create_future()
+
+    @property
+    def position(self):
+        """Сколько заданий впереди в очереди (0 — уже выполняется или следующее)."""
+        if self.running or self.future.done():
+            return 0
+        return max(0, self.seq - self.pool.taken - 1)
+
+    async def wait(self):
+        # shield: отмена одного ожидающего не отменяет общее задание
+        return await asyncio.shield(self.future)
+
+
+class _Pool:
+    def __init__(self, source, workers, queue_size):
+        self.source = source
+        self.size = workers
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.workers = []
+        self.submitted = 0
+        self.taken = 0
+
+    def start(self, scheduler):
+        if not self.workers:
+            self.workers = [
+                asyncio.create_task(scheduler._worker(self)) for _ in range(self.size)
+            ]
+
+
+class DownloadScheduler:
+    def __init__(self, workers=DOWNLOAD_WORKERS, default_workers=DOWNLOAD_DEFAULT_WORKERS,
+                 queue_size=DOWNLOAD_QUEUE_SIZE):
+        self.worker_counts = workers
+        self.default_workers = default_workers
+        self.queue_size = queue_size
+        self._pools = {}
+        self._jobs = {}   # key -> Job в очереди или в работе
+
+    def _pool(self, source):
+        pool = self._pools.get(source)
+        if pool is None:
+            count = self.worker_counts.get(source, self.default_workers)
+            pool = _Pool(source, count, self.queue_size)
+            self._pools[source] = pool
+        pool.start(self)
+        return pool
+
+    def submit(self, key, source, factory):
+        """
+        Ставит задание factory() (корутина) в очередь источника source.
+        Если задание с таким key уже есть — возвращает его.
+        Бросает SchedulerBusy, если очередь полна.
+        """
+        job = self._jobs.get(key)
+        if job is not None:
+            return job
+
+        pool = self._pool(source)
+        job = Job(pool, key, factory, pool.submitted + 1)
+        try:
+            pool.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise SchedulerBusy(f"Очередь {source} переполнена") from None
+
+        pool.submitted += 1
+        self._jobs[key] = job
+        return job
+
+    async def wait(self, job, factory):
+        """
+        Результат задания job, поставленного через submit(..., factory).
+        Если job чужое и упало — один раз выполняет своё factory в той же очереди.
+        """
+        try:
+            return await job.wait()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            if job.factory is factory:
+                raise
+        # отдельный ключ: повтор не склеивается ни с чьим заданием
+        retry = self.submit((job.key, "retry", id(factory)), job.pool.source, factory)
+        return await retry.wait()
+
+    async def _worker(self, pool):
+        while True:
+            job = await pool.queue.get()
+            pool.taken += 1
+            job.running = True
+            try:
+                job.future.set_result(await job.factory())
+            except asyncio.CancelledError:
+                job.future.cancel()
+                raise
+            except Exception as e:
+                job.future.set_exception(e)
+                # если результат никто не ждёт, не ругаемся "exception was never retrieved"
+                job.future.exception()
+            finally:
+                self._jobs.pop(job.key, None)
+                pool.queue.task_done()
+
+    def stats(self):
+        return {
+            source: {
+                "workers": pool.size,
+                "queued": pool.queue.qsize(),
+                "in_flight": sum(1 for j in self._jobs.values() if j.pool is pool),
+                "done": pool.taken,
+            }
+            for source, pool in self._pools.items()
+        }
+
+    async def stop(self):
+        for pool in self._pools.values():
+            for worker in pool.workers:
+                worker.cancel()
+            await asyncio.gather(*pool.workers, return_exceptions=True)
+            pool.workers = []
+
+        for job in self._jobs.values():
+            if not job.future.done():
+                job.future.cancel()
+        self._jobs.clear()
+        self._pools.clear()
+
+
+downloads = DownloadScheduler()
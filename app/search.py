@@ -0,0 +1,177 @@
+"""
+Поиск по всем источникам сразу.
+Провайдеры запускаются параллельно под общим дедлайном:
+кто успел — попадает в выдачу, кто опоздал — отменяется.
+"""
+import asyncio
+import logging
+import sys
+import time
+
+from app import metrics
+from app.breaker import ProviderUnavailable
+from app.cache import TTLCache
+from app.dedup import dedup_tracks
+from app.sessions import Track, compact_tracks
+from app.database.requests import (
+    search_skysound, search_soundcloud, rank_tracks_by_similarity, normalize_query
+)
+from app.settings import (
+    SEARCH_DEADLINE, PROVIDER_TIMEOUTS, DEDUP_ENABLED,
+    SEARCH_CACHE_TTL, SEARCH_CACHE_PARTIAL_TTL, SEARCH_CACHE_ENTRIES, SEARCH_CACHE_BYTES
+)
+
+
+# порядок важен: при одинаковой схожести выше окажется тот, кто раньше в списке
+PROVIDERS = {
+    "SkySound": search_skysound,
+    "SoundCloud": search_soundcloud,
+}
+
+
+def _tracks_size(tracks):
+    # грубая оценка: кортеж + объекты Track + их строки
+    size = sys.getsizeof(tracks)
+    for t in tracks:
+        size += sys.getsizeof(t)
+        for name in Track.__slots__:
+            value = getattr(t, name)
+            if isinstance(value, str):
+                size += len(value)
+    return size
+
+
+search_cache = TTLCache(
+    max_entries=SEARCH_CACHE_ENTRIES,
+    max_bytes=SEARCH_CACHE_BYTES,
+    ttl=SEARCH_CACHE_TTL,
+    sizeof=_tracks_size,
+)
+metrics.register_cache("search", search_cache)
+
+logger = logging.getLogger(__name__)
+
+
+def cache_key(query: str) -> str:
+    # нормализуем так же, как search_skysound строит поддомен;
+    # запросы без латиницы/кириллицы оставляем как есть
+    return normalize_query(query) or query.strip().lower()
+
+
+def is_cached(query: str) -> bool:
+    return cache_key(query) in search_cache
+
+
+async def _run_provider(name, provider, query, timeout):
+    start = time.perf_counter()
+    try:
+        if timeout:
+            tracks = await asyncio.wait_for(provider(query), timeout)
+        else:
+            tracks = await provider(query)
+        status = "ok"
+    except asyncio.TimeoutError:
+        tracks, status = [], "timeout"
+    except ProviderUnavailable:
+        tracks, status = [], "unavailable"
+    except Exception as e:
+        logger.warning("[%s] ошибка поиска: %s", name, e)
+        tracks, status = [], "error"
+
+    elapsed = time.perf_counter() - start
+    metrics.observe("search_provider_seconds", elapsed, provider=name, status=status)
+    return tracks or [], status, elapsed
+
+
+def _merge(query, tasks, done):
+    """Треки готовых провайдеров в порядке PROVIDERS -> дедуп -> ранжирование."""
+    tracks = []
+    for name, task in tasks.items():
+        if task in done:
+            tracks += task.result()[0]
+
+    with metrics.timer("rank_seconds"):
+        if DEDUP_ENABLED:
+            tracks = dedup_tracks(tracks)
+        return compact_tracks(rank_tracks_by_similarity(query, tracks))
+
+
+async def search_progressive(query: str, deadline: float = SEARCH_DEADLINE):
+    """
+    Как search_tracks, но отдаёт выдачу по мере ответа провайдеров:
+        async for tracks, timings, final in search_progressive(query): ...
+    Каждый раз tracks — заново ранжированная выдача всех, кто уже ответил.
+    Последний элемент имеет final=True и попадает в search_cache.
+    """
+    key = cache_key(query)
+    cached = search_cache.get(key)
+    if cached is not None:
+        logger.info("Поиск %r: из кэша (%d треков)", query, len(cached))
+        yield cached, {}, True
+        return
+
+    start = time.perf_counter()
+    tasks = {
+        name: asyncio.create_task(
+            _run_provider(name, provider, query, PROVIDER_TIMEOUTS.get(name))
+        )
+        for name, provider in PROVIDERS.items()
+    }
+
+    done = set()
+    pending = set(tasks.values())
+    timings = {}
+
+    try:
+        while pending:
+            remaining = deadline - (time.perf_counter() - start)
+            if remaining <= 0:
+                break
+
+            finished, pending = await asyncio.wait(
+                pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not finished:
+                break
+            done |= finished
+
+            for name, task in tasks.items():
+                if task in finished:
+                    found, status, elapsed = task.result()
+                    timings[name] = {"status": status, "time": elapsed, "count": len(found)}
+
+            if pending and any(task.result()[0] for task in finished):
+                yield _merge(query, tasks, done), timings, False
+
+    finally:
+        for task in pending:
+            task.cancel()
+
+    for name, task in tasks.items():
+        if task not in done:
+            timings[name] = {"status": "cancelled", "time": time.perf_counter() - start, "count": 0}
+
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("Поиск %r: %s", query, ", ".join(
+            f"{name}={t['status']} {t['time']:.2f}s/{t['count']}" for name, t in timings.items()
+        ))
+
+    tracks = _merge(query, tasks, done)
+
+    # если кто-то из источников не ответил — кэшируем ненадолго
+    complete = all(t["status"] == "ok" for t in timings.values())
+    search_cache.set(key, tracks, ttl=None if complete else SEARCH_CACHE_PARTIAL_TTL)
+
+    yield tracks, timings, True
+
+
+async def search_tracks(query: str, deadline: float = SEARCH_DEADLINE):
+    """
+    Ищет трек во всех PROVIDERS одновременно.
+    Возвращает (кортеж ранжированных Track, тайминги по провайдерам):
+    timings = {"SkySound": {"status": "ok", "time": 0.8}, ...}
+    Повторные запросы отдаются из search_cache (timings тогда пустой).
+    """
+    async for tracks, timings, final in search_progressive(query, deadline):
+        if final:
+            return tracks, timings
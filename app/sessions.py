@@ -0,0 +1,143 @@
+"""
+Выдача поиска для каждого пользователя: для кнопок play_/page_ в чате и для inline.
+Где хранить — решает SESSION_BACKEND (app/state.py): в памяти процесса
+или в общей базе, чтобы кнопку мог обслужить любой процесс-воркер.
+Треки хранятся компактно (Track со __slots__), строки интернированы,
+а один и тот же набор треков разделяется кэшем поиска, чатом и inline.
+"""
+import json
+import sys
+
+from app.settings import (
+    CHAT_SESSION_TTL, CHAT_SESSION_ENTRIES, INLINE_SESSION_TTL, INLINE_SESSION_ENTRIES,
+    SESSION_BACKEND
+)
+from app.state import MemoryState, SQLiteState
+
+
+class Track:
+    __slots__ = ("title", "artist", "duration", "url", "thumb", "source", "alternates")
+
+    def __init__(self, title, artist, duration, url, thumb, source, alternates=()):
+        self.title = _intern(title)
+        self.artist = _intern(artist)
+        self.duration = _intern(duration)
+        self.url = url
+        self.thumb = thumb
+        self.source = _intern(source)
+        self.alternates = alternates   # тот же трек из других источников (app/dedup.py)
+
+    @classmethod
+    def from_dict(cls, track):
+        return cls(
+            track.get("title", ""),
+            track.get("artist", ""),
+            track.get("duration", "?:??"),
+            track["url"],
+            track.get("thumb"),
+            track["source"],
+            compact_tracks(track.get("alternates", ())),
+        )
+
+    # доступ как к dict, чтобы не переписывать track["title"] по всему коду
+    def __getitem__(self, name):
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name) from None
+
+    def get(self, name, default=None):
+        return getattr(self, name, default)
+
+    def __repr__(self):
+        return f"Track({self.source}: {self.artist} - {self.title})"
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def compact_tracks(tracks):
+    """Список dict-треков -> кортеж Track."""
+    return tuple(t if isinstance(t, Track) else Track.from_dict(t) for t in tracks)
+
+
+def _dumps(tracks):
+    return json.dumps([_track_dict(t) for t in tracks], ensure_ascii=False, separators=(",", ":"))
+
+
+def _track_dict(track):
+    data = {name: getattr(track, name) for name in Track.__slots__ if name != "alternates"}
+    if track.alternates:
+        data["alternates"] = [_track_dict(t) for t in track.alternates]
+    return data
+
+
+def _loads(data):
+    return compact_tracks(json.loads(data))
+
+
+def _make_backend():
+    if SESSION_BACKEND == "sqlite":
+        return SQLiteState(CHAT_SESSION_TTL, INLINE_SESSION_TTL, dumps=_dumps, loads=_loads)
+    return MemoryState(CHAT_SESSION_TTL, CHAT_SESSION_ENTRIES, INLINE_SESSION_TTL, INLINE_SESSION_ENTRIES)
+
+
+backend = _make_backend()
+
+
+# --- Чат ---
+
+async def set_chat_tracks(user_id, tracks):
+    """Сохраняет выдачу пользователя, возвращает её версию (для callback_data)."""
+    return await backend.set_chat(user_id, tracks)
+
+
+async def get_chat_tracks(user_id, version=None):
+    """Текущая выдача пользователя; None, если её нет или version устарела."""
+    session = await backend.get_chat(user_id)
+    if session is None:
+        return None
+
+    current, tracks = session
+    if version is not None and version != current:
+        return None
+    return tracks
+
+
+async def get_chat_version(user_id):
+    session = await backend.get_chat(user_id)
+    return session[0] if session else None
+
+
+# --- Inline ---
+
+async def set_inline_tracks(user_id, tracks):
+    """Сохраняет inline-выдачу целиком (все страницы), возвращает её set_id."""
+    return await backend.set_inline(user_id, tracks)
+
+
+async def get_inline_tracks(user_id, set_id):
+    """Сохранённая inline-выдача или None, если она истекла."""
+    return await backend.get_inline(user_id, set_id)
+
+
+def inline_result_id(user_id, set_id, index):
+    return f"{user_id}:{set_id}:{index}"
+
+
+async def get_inline_track(result_id):
+    """result_id вида "<user_id>:<set_id>:<index>" -> Track или None."""
+    try:
+        user_id, set_id, index = map(int, result_id.split(":"))
+    except ValueError:
+        return None
+
+    tracks = await backend.get_inline(user_id, set_id)
+    if tracks is None or index >= len(tracks):
+        return None
+    return tracks[index]
+
+
+async def stats():
+    return await backend.stats()
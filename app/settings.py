@@ -0,0 +1,155 @@
+"""
+Необязательные настройки бота.
+Берутся из config.py, если там заданы, иначе используются значения по умолчанию.
+"""
+import config
+
+
+def _get(name, default):
+    return getattr(config, name, default)
+
+
+# --- HTTP-клиент ---
+HTTP_LIMIT = _get("HTTP_LIMIT", 100)                    # всего соединений
+HTTP_LIMIT_PER_HOST = _get("HTTP_LIMIT_PER_HOST", 20)   # соединений на один хост
+HTTP_DNS_TTL = _get("HTTP_DNS_TTL", 300)                # сек, кэш DNS
+HTTP_KEEPALIVE = _get("HTTP_KEEPALIVE", 30)             # сек, keep-alive
+HTTP_CONNECT_TIMEOUT = _get("HTTP_CONNECT_TIMEOUT", 10)
+HTTP_TIMEOUT = _get("HTTP_TIMEOUT", 300)
+
+# --- Адреса источников (меняются, например, для bench/bench_e2e.py) ---
+SOUNDCLOUD_API = _get("SOUNDCLOUD_API", "https://api-v2.soundcloud.com")
+SKYSOUND_ARTIST_URL = _get("SKYSOUND_ARTIST_URL", "https://{artist}.skysound7.com/")
+
+# --- Поиск ---
+SEARCH_DEADLINE = _get("SEARCH_DEADLINE", 10)                 # сек, общий дедлайн поиска в чате
+INLINE_SEARCH_DEADLINE = _get("INLINE_SEARCH_DEADLINE", 5)    # сек, inline-ответ должен успеть
+PROVIDER_TIMEOUTS = _get("PROVIDER_TIMEOUTS", {})             # {"SkySound": 8, ...}
+SEARCH_CACHE_TTL = _get("SEARCH_CACHE_TTL", 600)              # сек
+SEARCH_CACHE_PARTIAL_TTL = _get("SEARCH_CACHE_PARTIAL_TTL", 30)  # сек, если какой-то источник не ответил
+SEARCH_CACHE_ENTRIES = _get("SEARCH_CACHE_ENTRIES", 500)
+SEARCH_CACHE_BYTES = _get("SEARCH_CACHE_BYTES", 32 * 1024 * 1024)
+
+# --- Скачивание ---
+DOWNLOAD_DIR = _get("DOWNLOAD_DIR", None)                       # None — во временной папке системы
+DOWNLOAD_CHUNK_SIZE = _get("DOWNLOAD_CHUNK_SIZE", 64 * 1024)
+DOWNLOAD_MIN_SIZE = _get("DOWNLOAD_MIN_SIZE", 50000)            # меньше — битый файл / превью
+DOWNLOAD_MAX_SIZE = _get("DOWNLOAD_MAX_SIZE", 50 * 1024 * 1024) # лимит загрузки Bot API
+DOWNLOAD_TIMEOUT = _get("DOWNLOAD_TIMEOUT", 30)
+DOWNLOAD_PROBE = _get("DOWNLOAD_PROBE", True)              # проверить первые байты и размер до скачивания
+DOWNLOAD_PROBE_BYTES = _get("DOWNLOAD_PROBE_BYTES", 4096)
+# длинные миксы качаются кусками (Range) в несколько соединений, если сервер это умеет
+DOWNLOAD_PARALLEL_MIN_SIZE = _get("DOWNLOAD_PARALLEL_MIN_SIZE", 8 * 1024 * 1024)  # меньше — одним потоком
+DOWNLOAD_PARALLEL = _get("DOWNLOAD_PARALLEL", 4)                   # соединений на один файл, не больше
+DOWNLOAD_PART_MIN = _get("DOWNLOAD_PART_MIN", 1024 * 1024)         # границы размера куска
+DOWNLOAD_PART_MAX = _get("DOWNLOAD_PART_MAX", 8 * 1024 * 1024)
+
+# --- Кэш прямых mp3-ссылок ---
+RESOLVE_CACHE_TTL = _get("RESOLVE_CACHE_TTL", 300)          # сек, если в ссылке нет срока действия
+RESOLVE_CACHE_ENTRIES = _get("RESOLVE_CACHE_ENTRIES", 5000)
+RESOLVE_EXPIRY_MARGIN = _get("RESOLVE_EXPIRY_MARGIN", 60)   # сек запаса до истечения подписи
+
+# --- Сессии пользователей (выдача для play_/page_ и inline) ---
+CHAT_SESSION_TTL = _get("CHAT_SESSION_TTL", 3600)         # сек
+CHAT_SESSION_ENTRIES = _get("CHAT_SESSION_ENTRIES", 10000)
+INLINE_SESSION_TTL = _get("INLINE_SESSION_TTL", 600)      # сек
+INLINE_SESSION_ENTRIES = _get("INLINE_SESSION_ENTRIES", 50000)
+
+# --- Предзагрузка топа выдачи ---
+PREFETCH_ENABLED = _get("PREFETCH_ENABLED", False)
+PREFETCH_TOP_N = _get("PREFETCH_TOP_N", 3)                     # сколько первых треков готовить
+PREFETCH_DOWNLOAD = _get("PREFETCH_DOWNLOAD", False)           # False — только получать ссылки
+PREFETCH_CONCURRENCY = _get("PREFETCH_CONCURRENCY", 4)         # на весь бот
+PREFETCH_BANDWIDTH = _get("PREFETCH_BANDWIDTH", 4 * 1024 * 1024)  # байт/сек на весь бот, 0 — без лимита
+PREFETCH_CACHE_TTL = _get("PREFETCH_CACHE_TTL", 600)           # сек
+PREFETCH_CACHE_BYTES = _get("PREFETCH_CACHE_BYTES", 512 * 1024 * 1024)
+
+# --- Очередь загрузок ---
+DOWNLOAD_WORKERS = _get("DOWNLOAD_WORKERS", {"SoundCloud": 4, "SkySound": 4})  # воркеров на источник
+DOWNLOAD_DEFAULT_WORKERS = _get("DOWNLOAD_DEFAULT_WORKERS", 2)
+DOWNLOAD_QUEUE_SIZE = _get("DOWNLOAD_QUEUE_SIZE", 100)       # заданий в очереди одного источника
+
+# --- Ранжирование ---
+# итог = max(title * схожесть названия, artist * схожесть исполнителя)
+#        + source[источник] + duration * (длительность похожа на песню)
+RANK_WEIGHTS = _get("RANK_WEIGHTS", {"title": 1.0, "artist": 1.0, "source": {}, "duration": 0.0})
+
+# --- Склейка дублей из разных источников ---
+DEDUP_ENABLED = _get("DEDUP_ENABLED", True)
+DEDUP_DURATION_TOLERANCE = _get("DEDUP_DURATION_TOLERANCE", 5)               # сек
+DEDUP_SOURCE_PREFERENCE = _get("DEDUP_SOURCE_PREFERENCE", ["SkySound", "SoundCloud"])  # кого оставлять
+
+# --- Разбор страниц SkySound ---
+SKYSOUND_PARSER = _get("SKYSOUND_PARSER", "lxml")                  # "lxml" или "bs4"
+SKYSOUND_EXECUTOR_BYTES = _get("SKYSOUND_EXECUTOR_BYTES", 100_000)  # страницы больше — в отдельном потоке
+SEARCH_PROGRESSIVE = _get("SEARCH_PROGRESSIVE", True)      # показывать выдачу первого ответившего источника
+SEARCH_EDIT_INTERVAL = _get("SEARCH_EDIT_INTERVAL", 1.0)   # сек между правками клавиатуры в одном чате
+
+# --- Inline-режим ---
+INLINE_PAGE_SIZE = _get("INLINE_PAGE_SIZE", 18)          # результатов в одном ответе (макс. 50)
+INLINE_CACHE_TIME = _get("INLINE_CACHE_TIME", 300)       # сек, кэш ответа на стороне Telegram
+INLINE_IS_PERSONAL = _get("INLINE_IS_PERSONAL", True)    # id результатов ссылаются на сессию пользователя
+INLINE_DEBOUNCE = _get("INLINE_DEBOUNCE", 0.3)           # сек тишины перед поиском
+INLINE_DEBOUNCE_SHORT = _get("INLINE_DEBOUNCE_SHORT", 0.8)  # сек для коротких префиксов
+INLINE_SHORT_QUERY = _get("INLINE_SHORT_QUERY", 4)       # короче — считается коротким префиксом
+
+# --- Обложки ---
+THUMB_PATH = _get("THUMB_PATH", "tttumb.jpg")                    # обложка по умолчанию (её пишет админ)
+ARTWORK_ENABLED = _get("ARTWORK_ENABLED", True)                  # обложка трека вместо общей
+ARTWORK_DIR = _get("ARTWORK_DIR", "artwork_cache")
+ARTWORK_DISK_BYTES = _get("ARTWORK_DISK_BYTES", 200 * 1024 * 1024)
+ARTWORK_MEMORY_BYTES = _get("ARTWORK_MEMORY_BYTES", 16 * 1024 * 1024)
+ARTWORK_TIMEOUT = _get("ARTWORK_TIMEOUT", 5)
+
+# --- Локальный кэш mp3 (app/audio_cache.py) ---
+AUDIO_CACHE_ENABLED = _get("AUDIO_CACHE_ENABLED", True)          # повторная отправка без скачивания
+AUDIO_CACHE_DIR = _get("AUDIO_CACHE_DIR", "audio_cache")
+AUDIO_CACHE_BYTES = _get("AUDIO_CACHE_BYTES", 2 * 1024 * 1024 * 1024)  # бюджет на диске, лишнее вытесняется (LRU)
+
+# --- База данных ---
+DB_URL = _get("DB_URL", "sqlite+aiosqlite:///db.sqlite3")
+DB_ECHO = _get("DB_ECHO", False)                     # логировать каждый SQL-запрос
+DB_BUSY_TIMEOUT = _get("DB_BUSY_TIMEOUT", 5000)      # мс, ожидание блокировки SQLite
+DB_WRITE_BEHIND = _get("DB_WRITE_BEHIND", True)      # копить вставки и писать пачками
+DB_FLUSH_INTERVAL = _get("DB_FLUSH_INTERVAL", 1.0)   # сек между сбросами пачки
+DB_BATCH_SIZE = _get("DB_BATCH_SIZE", 500)           # сбросить раньше, если набралось столько
+
+# --- Логи и метрики ---
+LOG_LEVEL = _get("LOG_LEVEL", "INFO")              # DEBUG покажет подробности поиска и загрузки
+METRICS_HOST = _get("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = _get("METRICS_PORT", 9181)          # None — не поднимать /metrics
+
+# --- Приём апдейтов ---
+BOT_MODE = _get("BOT_MODE", "polling")                # "polling" или "webhook"
+UPDATES_CONCURRENCY = _get("UPDATES_CONCURRENCY", 100)  # апдейтов в обработке одновременно, None — без лимита
+WEBHOOK_URL = _get("WEBHOOK_URL", None)               # внешний адрес, https://bot.example.com; None — вебхук ставится вручную
+WEBHOOK_PATH = _get("WEBHOOK_PATH", "/webhook")
+WEBHOOK_HOST = _get("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = _get("WEBHOOK_PORT", 8080)
+WEBHOOK_SECRET = _get("WEBHOOK_SECRET", None)         # None — генерируется при старте (нужен WEBHOOK_URL)
+WEBHOOK_MAX_CONNECTIONS = _get("WEBHOOK_MAX_CONNECTIONS", 40)  # одновременных запросов от Telegram
+WEBHOOK_DRAIN_TIMEOUT = _get("WEBHOOK_DRAIN_TIMEOUT", 30)      # сек на дообработку апдейтов при остановке
+
+# --- Где хранить выдачу (app/state.py) ---
+SESSION_BACKEND = _get("SESSION_BACKEND", "memory")   # "memory" — один процесс, "sqlite" — общая для воркеров
+
+# --- Ограничение частоты исходящих запросов (app/ratelimit.py) ---
+TELEGRAM_RATE = _get("TELEGRAM_RATE", 30)             # отправок/правок в секунду на весь бот
+TELEGRAM_BURST = _get("TELEGRAM_BURST", 30)
+TELEGRAM_CHAT_RATE = _get("TELEGRAM_CHAT_RATE", 1)    # в секунду в один чат
+TELEGRAM_CHAT_BURST = _get("TELEGRAM_CHAT_BURST", 5)
+TELEGRAM_MAX_RETRIES = _get("TELEGRAM_MAX_RETRIES", 3)  # повторов после 429 (retry_after)
+# хост (или его домен) -> (запросов в секунду, всплеск); поддомены SkySound делят один лимит
+UPSTREAM_RATE_LIMITS = _get("UPSTREAM_RATE_LIMITS", {"soundcloud.com": (10, 20), "skysound7.com": (10, 20)})
+UPSTREAM_MAX_RETRIES = _get("UPSTREAM_MAX_RETRIES", 2)          # повторов после 429/503 с Retry-After
+UPSTREAM_MAX_RETRY_AFTER = _get("UPSTREAM_MAX_RETRY_AFTER", 30)  # сек; дольше не ждём — отдаём ответ как есть
+
+# --- Защита от падающих источников (app/breaker.py) ---
+BREAKER_FAILURES = _get("BREAKER_FAILURES", 5)        # ошибок подряд, после которых источник выключается
+BREAKER_COOLDOWN = _get("BREAKER_COOLDOWN", 30)       # сек до пробного запроса
+BREAKER_SLOW_CALL = _get("BREAKER_SLOW_CALL", 8)      # сек; запрос, отменённый позже, считается ошибкой
+HEDGE_RESOLVE = _get("HEDGE_RESOLVE", True)           # дублировать запрос mp3-ссылки, если он дольше p95
+HEDGE_SEARCH = _get("HEDGE_SEARCH", False)            # то же для поиска
+HEDGE_MIN_SAMPLES = _get("HEDGE_MIN_SAMPLES", 20)     # пока замеров меньше — не дублируем
+HEDGE_MIN_DELAY = _get("HEDGE_MIN_DELAY", 0.05)       # сек, раньше не дублируем даже при быстром p95
+LATENCY_WINDOW = _get("LATENCY_WINDOW", 200)          # последних замеров для p95
@@ -0,0 +1,179 @@
+"""
+Хранилища выдачи пользователей (app/sessions.py) — выбираются SESSION_BACKEND:
+- "memory" — в памяти процесса (TTL + LRU), быстро, но callback должен прийти в тот же процесс;
+- "sqlite" — таблицы chat_sessions / inline_sessions в общей базе: любой процесс-воркер
+  за одним вебхуком или разделителем polling обслужит кнопку, нажатую в чужой выдаче.
+Версии чат-выдачи и id inline-наборов выдаёт само хранилище, так что они не пересекаются
+между процессами.
+"""
+import sys
+import time
+from itertools import count
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.sqlite import insert
+
+from app.cache import TTLCache
+from app.database.models import ChatSession, InlineSession, async_session
+
+
+class MemoryState:
+    def __init__(self, chat_ttl, chat_entries, inline_ttl, inline_entries):
+        self.chat = TTLCache(max_entries=chat_entries, ttl=chat_ttl, sizeof=self._chat_size)
+        self.inline = TTLCache(max_entries=inline_entries, ttl=inline_ttl, sizeof=self._tracks_size)
+        self._chat_versions = count(1)
+        self._inline_ids = count(1)
+
+    @staticmethod
+    def _tracks_size(tracks):
+        # сами Track общие, сессия держит только кортеж ссылок
+        return sys.getsizeof(tracks)
+
+    @classmethod
+    def _chat_size(cls, session):
+        version, tracks = session
+        return sys.getsizeof(session) + cls._tracks_size(tracks)
+
+    async def set_chat(self, user_id, tracks):
+        version = next(self._chat_versions)
+        self.chat.set(user_id, (version, tracks))
+        return version
+
+    async def get_chat(self, user_id):
+        return self.chat.get(user_id)
+
+    async def set_inline(self, user_id, tracks):
+        set_id = next(self._inline_ids)
+        self.inline.set((user_id, set_id), tracks)
+        return set_id
+
+    async def get_inline(self, user_id, set_id):
+        return self.inline.get((user_id, set_id))
+
+    async def stats(self):
+        """Размеры хранилищ, вытеснения и оценка памяти (общие объекты считаются один раз)."""
+        seen = set()
+        track_count = 0
+        track_bytes = 0
+
+        sessions = [tracks for _, tracks in self.chat.values()] + self.inline.values()
+
+        for tracks in sessions:
+            for track in tracks:
+                if id(track) in seen:
+                    continue
+                seen.add(id(track))
+                track_count += 1
+                track_bytes += sys.getsizeof(track)
+                for name in getattr(track, "__slots__", ()):
+                    value = getattr(track, name)
+                    if isinstance(value, str) and id(value) not in seen:
+                        seen.add(id(value))
+                        track_bytes += sys.getsizeof(value)
+
+        return {
+            "chat": self.chat.stats(),
+            "inline": self.inline.stats(),
+            "tracks": track_count,
+            "bytes": track_bytes + self.chat.bytes + self.inline.bytes,
+        }
+
+
+class SQLiteState:
+    """
+    Выдача хранится сериализованной (dumps/loads из app/sessions.py) со сроком expires_at.
+    Истёкшие строки не читаются и раз в purge_interval удаляются.
+    """
+
+    def __init__(self, chat_ttl, inline_ttl, dumps, loads, purge_interval=60):
+        self.chat_ttl = chat_ttl
+        self.inline_ttl = inline_ttl
+        self.dumps = dumps
+        self.loads = loads
+        self.purge_interval = purge_interval
+        self._next_purge = 0.0
+        self.reads = 0
+        self.misses = 0
+
+    async def _purge(self, session, now):
+        if now < self._next_purge:
+            return
+        self._next_purge = now + self.purge_interval
+        await session.execute(delete(ChatSession).where(ChatSession.expires_at <= now))
+        await session.execute(delete(InlineSession).where(InlineSession.expires_at <= now))
+
+    async def set_chat(self, user_id, tracks):
+        now = time.time()
+        # версия растёт атомарно в той же строке — два процесса не выдадут одну и ту же
+        statement = insert(ChatSession).values(
+            user_id=user_id, version=1, tracks=self.dumps(tracks), expires_at=now + self.chat_ttl
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[ChatSession.user_id],
+            set_={
+                "version": ChatSession.version + 1,
+                "tracks": statement.excluded.tracks,
+                "expires_at": statement.excluded.expires_at,
+            },
+        ).returning(ChatSession.version)
+
+        async with async_session() as session:
+            version = await session.scalar(statement)
+            await self._purge(session, now)
+            await session.commit()
+        return version
+
+    async def get_chat(self, user_id):
+        self.reads += 1
+        async with async_session() as session:
+            row = (await session.execute(
+                select(ChatSession.version, ChatSession.tracks)
+                .where(ChatSession.user_id == user_id, ChatSession.expires_at > time.time())
+            )).first()
+        if row is None:
+            self.misses += 1
+            return None
+        return row.version, self.loads(row.tracks)
+
+    async def set_inline(self, user_id, tracks):
+        now = time.time()
+        async with async_session() as session:
+            set_id = await session.scalar(
+                insert(InlineSession)
+                .values(user_id=user_id, tracks=self.dumps(tracks), expires_at=now + self.inline_ttl)
+                .returning(InlineSession.id)
+            )
+            await self._purge(session, now)
+            await session.commit()
+        return set_id
+
+    async def get_inline(self, user_id, set_id):
+        self.reads += 1
+        async with async_session() as session:
+            data = await session.scalar(
+                select(InlineSession.tracks).where(
+                    InlineSession.id == set_id,
+                    InlineSession.user_id == user_id,
+                    InlineSession.expires_at > time.time(),
+                )
+            )
+        if data is None:
+            self.misses += 1
+            return None
+        return self.loads(data)
+
+    async def stats(self):
+        now = time.time()
+        async with async_session() as session:
+            chat = await session.scalar(
+                select(func.count()).select_from(ChatSession).where(ChatSession.expires_at > now)
+            )
+            inline = await session.scalar(
+                select(func.count()).select_from(InlineSession).where(InlineSession.expires_at > now)
+            )
+        return {
+            "chat": chat,
+            "inline": inline,
+            "reads": self.reads,
+            "hit_rate": 1 - self.misses / self.reads if self.reads else 0.0,
+        }
@@ -1,24 +1,33 @@
 from aiogram import Router, F
-import aiohttp
 import io
-import tempfile
-import re
 import html
+import time
+import asyncio
+import logging
 from aiogram.types import Message, CallbackQuery, BufferedInputFile, FSInputFile
 from aiogram.filters import CommandStart, Command
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
 
-from app.database.requests import set_user, search_skysound, search_soundcloud, rank_tracks_by_similarity
-from app.database.requests import get_soundcloud_mp3_url
+from app.database.requests import set_user
+from app.database.requests import download_track, track_key, get_file_id, set_file_id, delete_file_id
 from app.keyboard import build_tracks_keyboard
+from app.search import search_progressive
+from app.sessions import set_chat_tracks, get_chat_tracks, get_chat_version
+from app.settings import SEARCH_PROGRESSIVE, SEARCH_EDIT_INTERVAL
+from app import metrics, prefetch
+from app.artwork import get_thumbnail
+from app.scheduler import downloads, SchedulerBusy
 
 
 user = Router()
-user_tracks = {}
+logger = logging.getLogger(__name__)
 
 file_01 = "AgACAgIAAxkBAAIE52kgt3bMrOFh_E8zC13pEFXhAco9AALjEGsbdTMAAUlnAmO6fj4n1AEAAwIAA20AAzYE"
 sticker01 = "CAACAgIAAxkBAAICemkroKC1Fsh8FpcYKne9A5s5QvtrAAIPkQACd0NZSXusnKn7HweeNgQ"
 sticker02 = "CAACAgIAAxkBAAICmGkrpgcET5MFuf_4LNNR_nQmqNwmAAIGiAACVAxhSTGEsC0p0xNcNgQ"
 
+CAPTION = '<a href="https://t.me/eschalon">eschalon</a>, <a href="t.me/eschalonmusicbot">music</a>'
+
 @user.message(CommandStart())
 async def cmd_start(message: Message):
     await set_user(message.from_user.id)
@@ -29,104 +38,146 @@ async def cmd_start(message: Message):
 @user.message(F.text)
 async def handle_message(message: Message):
     query = message.text.strip()
+    user_id = message.from_user.id
     status = await message.answer("подожди...")
+    prefetch.cancel(user_id)
+
+    tracks = ()
+    last_edit = 0.0
+
+    # 🔍 Ищем во всех источниках сразу; клавиатура обновляется по мере ответов
+    async for tracks, _, final in search_progressive(query):
+        if not tracks or (not final and not SEARCH_PROGRESSIVE):
+            continue
+
+        # не чаще раза в SEARCH_EDIT_INTERVAL: промежуточную правку пропускаем, финальную дожидаемся
+        wait = SEARCH_EDIT_INTERVAL - (time.monotonic() - last_edit)
+        if wait > 0:
+            if not final:
+                continue
+            await asyncio.sleep(wait)
 
-    tracks = []
-    tracks += await search_skysound(query)
-    tracks += await search_soundcloud(query)
+        version = await set_chat_tracks(user_id, tracks)
+        keyboard = build_tracks_keyboard(tracks, page=1, version=version)
+        text = "Выберите трек из списка:" if final else "Выберите трек из списка (ищу ещё…):"
+
+        if final:
+            await status.edit_text(text, reply_markup=keyboard.as_markup())
+        else:
+            try:
+                await status.edit_text(text, reply_markup=keyboard.as_markup())
+            except Exception as e:
+                logger.warning("Не удалось обновить выдачу: %s", e)
+        last_edit = time.monotonic()
 
     if not tracks:
         await status.edit_text(f"«{query}» - ничего не найдено. Проверь правильность написания.")
         return
 
-    # 🔍 Ранжируем по схожести
-    tracks = rank_tracks_by_similarity(query, tracks)
-
-    user_tracks[message.from_user.id] = tracks
-    keyboard = build_tracks_keyboard(tracks, page=1)
-
-    await status.edit_text(
-        "Выберите трек из списка:",
-        reply_markup=keyboard.as_markup()
+    # пока пользователь выбирает — готовим первые треки
+    prefetch.schedule(user_id, tracks)
+
+async def send_cached_audio(message: Message, track, file_id):
+    """Отправляет уже загруженный в Telegram трек по file_id вместо сообщения со списком."""
+    await message.answer_audio(
+        audio=file_id,
+        title=track['title'],
+        performer=track['artist'],
+        caption=CAPTION,
+        parse_mode="HTML"
     )
+    # аудио уже отправлено: список мог удалить двойной тап — это не ошибка отправки
+    try:
+        await message.delete()
+    except TelegramAPIError as e:
+        logger.debug("Не удалось удалить список: %s", e)
+
 
 # ---------- Callback ----------
 @user.callback_query(F.data.startswith("play_"))
 async def play_track(callback: CallbackQuery):
     user_id = callback.from_user.id
-    index = int(callback.data.split("_")[1])
+    parts = callback.data.split("_")
+    index = int(parts[1])
+    version = int(parts[2]) if len(parts) > 2 else None
 
-    if user_id not in user_tracks or index >= len(user_tracks[user_id]):
-        await callback.answer("⚠️ Трек не найден.")
+    tracks = await get_chat_tracks(user_id, version)
+    if tracks is None or index >= len(tracks):
+        await callback.answer("⚠️ Трек не найден, список обновился — выбери ещё раз.")
         return
 
-    track = user_tracks[user_id][index]
-    url = track["url"]
+    track = tracks[index]
     title = f"{track['artist']} — {track['title']}"
+    key = track_key(track)
+
+    # --- Трек уже был в Telegram: отправляем по file_id без скачивания ---
+    file_id = await get_file_id(key)
+    metrics.inc("file_id_cache_total", result="hit" if file_id else "miss")
+    if file_id:
+        try:
+            await send_cached_audio(callback.message, track, file_id)
+        except TelegramBadRequest as e:
+            # Telegram не принял сам file_id — забываем его и загружаем заново
+            metrics.inc("file_id_cache_total", result="stale")
+            logger.warning("file_id из кэша не подошёл: %s", e)
+            await delete_file_id(key)
+        else:
+            await callback.message.answer_sticker(sticker=sticker01)
+            return
 
+    delivered = False
+
+    async def deliver():
+        """Скачивает и отправляет трек в этот чат; file_id достанется всем, кто ждёт этот трек."""
+        nonlocal delivered
+
+        # --- mp3 из локального кэша или скачиваем (временные файлы удаляются после отправки) ---
+        async with download_track(track) as path:
+            if not path:
+                return None
+
+            audio_file = FSInputFile(path, filename=f"{title}.mp3")
+            thumb = await get_thumbnail(track)
+
+            # --- Отправляем аудио ---
+            await callback.message.delete()
+            with metrics.timer("telegram_upload_seconds", mode="chat"):
+                sent = await callback.message.answer_audio(
+                    audio=audio_file,
+                    title=track['title'],
+                    performer=track['artist'],
+                    thumbnail=thumb,
+                    caption=CAPTION,
+                    parse_mode="HTML"
+                )
+        delivered = True
+
+        if not sent.audio:
+            return None
+        await set_file_id(key, sent.audio.file_id)
+        return sent.audio.file_id
 
     try:
-        mp3_url = None
+        job = downloads.submit(key, track["source"], deliver)
+        if job.position:
+            await callback.message.edit_text(f"⏳ Очередь загрузки: {job.position}")
 
-        if track["source"] == "SoundCloud":
-            mp3_url = await get_soundcloud_mp3_url(url)
-            if not mp3_url:
-                await callback.message.edit_text("Не удалось получить mp3 =(")
-                return
+        file_id = await downloads.wait(job, deliver)
 
-        else:
-            # --- SkySound: ищем mp3 через регулярку на странице ---
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=15) as resp:
-                    html = await resp.text()
-            mp3_links = re.findall(r'https:\/\/[^\s"]+\.mp3', html)
-            if not mp3_links:
-                print(f"🚫 [SkySound] mp3 не найден")
-                await callback.message.edit_text("Не удалось получить mp3  =(")
+        if not delivered:
+            # трек качал кто-то другой — шлём его file_id
+            if not file_id:
+                await callback.message.edit_text("😔 Не удалось скачать трек.")
                 return
-            mp3_url = mp3_links[0]
-
-        # --- Скачиваем mp3 ---
-        headers = {
-            "User-Agent": "Mozilla/5.0",
-            "Referer": "https://soundcloud.com/" if track["source"] == "SoundCloud" else "https://skysound7.com/"
-        }
-        async with aiohttp.ClientSession() as session:
-            async with session.get(mp3_url, headers=headers, timeout=30) as resp:
-                if resp.status != 200:
-                    print(f"⚠️ Ошибка загрузки mp3: {resp.status}")
-                    await callback.message.edit_text("😔 Не удалось скачать трек (код ответа).")
-                    return
-                audio_bytes = await resp.read()
-
-        # --- Проверяем размер ---
-        if len(audio_bytes) < 50000:
-            print("⚠️ mp3 слишком короткий, возможно битая ссылка.")
-            await callback.message.edit_text("😔 Файл поврежден или недоступен.")
-            return
+            await send_cached_audio(callback.message, track, file_id)
 
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as tmp:
-            tmp.write(audio_bytes)
-            tmp_path = tmp.name
-
-        audio_file = FSInputFile(tmp_path, filename=f"{title}.mp3")
-        ttumb = FSInputFile("ttumb.jpg")
-
-        # --- Отправляем аудио ---
-        await callback.message.delete()
-        await callback.message.answer_audio(
-            audio=audio_file,
-            title=track['title'],
-            performer=track['artist'],
-            thumb=ttumb,
-            caption= f'<a href="https://t.me/eschalon">eschalon</a>, <a href="t.me/eschalonmusicbot">music</a>',
-            parse_mode="HTML"
-        )
         await callback.message.answer_sticker(sticker=sticker01)
 
+    except SchedulerBusy:
+        await callback.answer("⚠️ Слишком много загрузок, попробуй через минуту.", show_alert=True)
 
     except Exception as e:
-        print(f"💥 Ошибка при отправке трека: {e}")
+        logger.exception("Ошибка при отправке трека: %s", e)
         await callback.message.answer("😔 Не удалось скачать трек.")
 
 
@@ -135,16 +186,16 @@ async def handle_page_callback(callback_query: CallbackQuery):
     try:
         page = int(callback_query.data.split("_")[1])
     except Exception:
-        print("⚠️ Ошибка парсинга номера страницы из callback_data:", callback_query.data)
+        logger.warning("Ошибка парсинга номера страницы из callback_data: %s", callback_query.data)
         return
 
     user_id = callback_query.from_user.id
-    if user_id not in user_tracks:
+    tracks = await get_chat_tracks(user_id)
+    if tracks is None:
         await callback_query.answer("⚠️ Треки не найдены, попробуй поиск заново.", show_alert=True)
         return
 
-    tracks = user_tracks[user_id]
-
-    keyboard = build_tracks_keyboard(tracks, page)
+    # старая клавиатура листается уже по актуальной выдаче
+    keyboard = build_tracks_keyboard(tracks, page, version=await get_chat_version(user_id))
     await callback_query.message.edit_reply_markup(reply_markup=keyboard.as_markup())
 
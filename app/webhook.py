@@ -0,0 +1,105 @@
+"""
+Приём апдейтов через вебхук (BOT_MODE = "webhook") вместо long polling.
+aiohttp-сервер с SimpleRequestHandler aiogram: Telegram получает ответ сразу,
+апдейт обрабатывается в фоне. Заголовок X-Telegram-Bot-Api-Secret-Token сверяется с секретом.
+Одновременно обрабатывается не больше UPDATES_CONCURRENCY апдейтов, остальные ждут.
+При остановке: перестаём принимать запросы, даём дообработаться начатым
+(до WEBHOOK_DRAIN_TIMEOUT), затем shutdown. Вебхук не снимается — Telegram
+придержит апдейты до следующего запуска; в режиме polling run.py снимает его сам.
+"""
+import asyncio
+import logging
+import secrets
+import signal
+
+from aiogram import BaseMiddleware
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from aiohttp import web
+
+from app.settings import (
+    UPDATES_CONCURRENCY, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_SECRET,
+    WEBHOOK_MAX_CONNECTIONS, WEBHOOK_DRAIN_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ConcurrencyLimit(BaseMiddleware):
+    """Outer-middleware на dp.update: лимит одновременно обрабатываемых апдейтов и учёт незаконченных."""
+
+    def __init__(self, limit=UPDATES_CONCURRENCY):
+        self._semaphore = asyncio.Semaphore(limit) if limit else None
+        self.pending = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def __call__(self, handler, event, data):
+        self.pending += 1
+        self._idle.clear()
+        try:
+            if self._semaphore is None:
+                return await handler(event, data)
+            async with self._semaphore:
+                return await handler(event, data)
+        finally:
+            self.pending -= 1
+            if not self.pending:
+                self._idle.set()
+
+    async def drain(self, timeout):
+        """Ждёт, пока все начатые апдейты обработаются; False — не успели за timeout."""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+def _stop_event():
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):   # Windows / не главный поток
+            pass
+    return stop
+
+
+async def run_webhook(dp, bot):
+    """Аналог dp.start_polling(bot) для вебхука: работает до SIGINT/SIGTERM."""
+    limit = ConcurrencyLimit()
+    dp.update.outer_middleware(limit)
+
+    secret = WEBHOOK_SECRET or (secrets.token_urlsafe(32) if WEBHOOK_URL else None)
+    if secret is None:
+        logger.warning("WEBHOOK_SECRET не задан — запросы на %s не проверяются", WEBHOOK_PATH)
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, SimpleRequestHandler(dp, bot, secret_token=secret).handle)
+    runner = web.AppRunner(app, access_log=None)
+
+    await dp.emit_startup(dispatcher=dp, bot=bot, bots=[bot])
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+    await site.start()
+
+    try:
+        if WEBHOOK_URL:
+            await bot.set_webhook(
+                WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                secret_token=secret,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=dp.resolve_used_update_types(),
+            )
+        logger.info("Вебхук: слушаю %s:%s%s", WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH)
+
+        await _stop_event().wait()
+    finally:
+        # новые запросы больше не принимаем, начатые апдейты дорабатываем
+        await site.stop()
+        if not await limit.drain(WEBHOOK_DRAIN_TIMEOUT):
+            logger.warning("Остановка: не дождались %d апдейтов", limit.pending)
+        await dp.emit_shutdown(dispatcher=dp, bot=bot, bots=[bot])
+        await runner.cleanup()
+        await bot.session.close()
@@ -0,0 +1,243 @@
+"""
+Сквозной бенчмарк бота на локальных заглушках (bench/standins.py) вместо SoundCloud, SkySound и Telegram.
+Синтетические пользователи параллельно проходят сценарий:
+    /start -> текстовый запрос (handle_message) -> play_0 (play_track)
+    -> inline-запрос (inline_search) -> выбор результата (diagnostic_chosen)
+Апдейты подаются в Dispatcher.feed_update, как при polling. В конце — p50/p99 по шагам,
+пропускная способность и пиковый RSS процесса бота (заглушки живут в отдельном процессе).
+
+Запуск из корня проекта:
+    python bench/bench_e2e.py --users 100 --concurrency 20 --queries 10
+    python bench/bench_e2e.py --latency 0.2 --mp3-size 8000000 --set SEARCH_EDIT_INTERVAL=0
+    python bench/bench_e2e.py --mp3-size 20000000 --mp3-rate 4000000 --set DOWNLOAD_PARALLEL=1
+Лимит частоты Telegram (TELEGRAM_RATE, 30/с) действует и здесь — чтобы мерить сам бот,
+а не лимит, добавьте --set TELEGRAM_RATE=None.
+"""
+import argparse
+import ast
+import asyncio
+import itertools
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+import types
+from collections import defaultdict
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import standins
+
+STEPS = ("start", "search", "play", "inline", "chosen")
+_ids = itertools.count(1)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50, help="синтетических пользователей")
+    parser.add_argument("--concurrency", type=int, default=20, help="пользователей одновременно")
+    parser.add_argument("--queries", type=int, default=10, help="разных запросов на всех")
+    parser.add_argument("--latency", type=float, default=0.05, help="сек, задержка каждой заглушки")
+    parser.add_argument("--mp3-size", type=int, default=4_000_000, help="байт в mp3")
+    parser.add_argument("--mp3-rate", type=int, default=None,
+                        help="байт/с отдачи mp3 на одно соединение (медленный CDN)")
+    parser.add_argument("--tracks", type=int, default=30, help="треков в ответе каждого источника")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE",
+                        help="переопределить настройку app/settings.py, например PREFETCH_ENABLED=True")
+    return parser.parse_args()
+
+
+def install_config(base, workdir, overrides):
+    """Модуль config для бота: все адреса смотрят на заглушки, настоящий config.py не нужен."""
+    config = types.ModuleType("config")
+    config.bot = None
+    config.SOUNDCLOUD_CLIENT_ID = "bench"
+    config.proxy_url = None
+    config.SOUNDCLOUD_API = f"{base}/sc"
+    config.SKYSOUND_ARTIST_URL = f"{base}/sky/{{artist}}/"
+    config.DB_URL = f"sqlite+aiosqlite:///{os.path.join(workdir, 'bench.sqlite3')}"
+    config.DOWNLOAD_DIR = os.path.join(workdir, "spool")
+    config.ARTWORK_DIR = os.path.join(workdir, "artwork")
+    config.AUDIO_CACHE_DIR = os.path.join(workdir, "audio")
+    config.THUMB_PATH = os.path.join(workdir, "thumb.jpg")
+    config.METRICS_PORT = None
+    config.LOG_LEVEL = "WARNING"
+
+    for item in overrides:
+        name, value = item.split("=", 1)
+        try:
+            value = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            pass
+        setattr(config, name, value)
+
+    sys.modules["config"] = config
+    return config
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class Driver:
+    def __init__(self, bot, dp, base, queries):
+        from aiogram import types as tg
+        self.tg = tg
+        self.bot = bot
+        self.dp = dp
+        self.base = base
+        self.queries = queries
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def _user(self, user_id):
+        return self.tg.User(id=user_id, is_bot=False, first_name=f"bench{user_id}")
+
+    def _message(self, user_id, text):
+        return self.tg.Message(
+            message_id=next(_ids), date=datetime.now(),
+            chat=self.tg.Chat(id=user_id, type="private"),
+            from_user=self._user(user_id), text=text,
+        )
+
+    async def _feed(self, step, **event):
+        update = self.tg.Update(update_id=next(_ids), **event)
+        start = time.perf_counter()
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception as e:
+            self.errors[step] += 1
+            if self.errors[step] == 1:
+                print(f"  ошибка на шаге {step}: {e!r}")
+            return False
+        self.latencies[step].append(time.perf_counter() - start)
+        return True
+
+    async def run_user(self, user_id):
+        from app.sessions import get_chat_version
+        from app import http
+
+        query = self.queries[user_id % len(self.queries)]
+
+        await self._feed("start", message=self._message(user_id, "/start"))
+        await self._feed("search", message=self._message(user_id, query))
+
+        version = await get_chat_version(user_id)
+        if version is not None:
+            await self._feed("play", callback_query=self.tg.CallbackQuery(
+                id=str(next(_ids)), from_user=self._user(user_id), chat_instance="bench",
+                message=self._message(user_id, "Выберите трек из списка:"),
+                data=f"play_0_{version}",
+            ))
+
+        query_id = str(next(_ids))
+        await self._feed("inline", inline_query=self.tg.InlineQuery(
+            id=query_id, from_user=self._user(user_id), query=query, offset="",
+        ))
+        async with http.get(f"{self.base}/bench/inline/{query_id}") as resp:
+            results = await resp.json()
+        if results:
+            await self._feed("chosen", chosen_inline_result=self.tg.ChosenInlineResult(
+                result_id=results[0]["id"], from_user=self._user(user_id), query=query,
+                inline_message_id=f"inline-{query_id}",
+            ))
+
+
+async def run(args, base, workdir):
+    from aiogram import Bot, Dispatcher
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+
+    from app.user import user
+    from app.admin import admin
+    from app.inline import router
+    from app.http import init_http, close_http
+    from app.download import cleanup_spool
+    from app.scheduler import downloads
+    from app.database.batcher import writes
+    from app.database.models import async_main, engine
+    from app import metrics
+    from app.ratelimit import TelegramRateLimit
+
+    bot = Bot("123456:BENCH", session=AiohttpSession(api=TelegramAPIServer.from_base(base)))
+    bot.session.middleware(TelegramRateLimit())
+    sys.modules["config"].bot = bot
+
+    dp = Dispatcher(allow_bot_messages=True)
+    dp.include_routers(admin, user, router)
+
+    await async_main()
+    await init_http()
+    cleanup_spool()
+
+    queries = [f"artist {i}" for i in range(args.queries)]
+    driver = Driver(bot, dp, base, queries)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(user_id):
+        async with semaphore:
+            await driver.run_user(user_id)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(1000 + i) for i in range(args.users)))
+    wall = time.perf_counter() - start
+
+    await downloads.stop()
+    await writes.stop()
+    await close_http()
+    await bot.session.close()
+    await engine.dispose()
+
+    return driver, wall, metrics.summary()
+
+
+def report(args, driver, wall, summary):
+    total = sum(len(v) for v in driver.latencies.values())
+    print(f"\nпользователей: {args.users}, одновременно: {args.concurrency}, "
+          f"запросов: {args.queries}, задержка заглушек: {args.latency * 1000:.0f} мс, "
+          f"mp3: {args.mp3_size // 1024} КБ")
+    print(f"{'шаг':<8} {'n':>5} {'ошибок':>7} {'p50, мс':>9} {'p99, мс':>9} {'макс, мс':>9}")
+    for step in STEPS:
+        values = driver.latencies[step]
+        print(f"{step:<8} {len(values):>5} {driver.errors[step]:>7} "
+              f"{percentile(values, 0.5) * 1000:>9.1f} {percentile(values, 0.99) * 1000:>9.1f} "
+              f"{(max(values) if values else 0) * 1000:>9.1f}")
+
+    print(f"\nвремя: {wall:.2f} с, сценариев/с: {args.users / wall:.1f}, апдейтов/с: {total / wall:.1f}")
+    # ru_maxrss в Linux — в КБ
+    print(f"пиковый RSS бота: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} МБ")
+    if summary:
+        print("\nметрики бота:\n" + summary)
+
+
+def main():
+    args = parse_args()
+
+    parent, child = multiprocessing.Pipe()
+    server = multiprocessing.Process(
+        target=standins.serve, args=(child,), daemon=True,
+        kwargs={"latency": args.latency, "mp3_size": args.mp3_size, "tracks": args.tracks,
+                "mp3_rate": args.mp3_rate},
+    )
+    server.start()
+    base = f"http://127.0.0.1:{parent.recv()}"
+
+    with tempfile.TemporaryDirectory(prefix="bench-e2e-") as workdir:
+        install_config(base, workdir, args.set)
+        try:
+            driver, wall, summary = asyncio.run(run(args, base, workdir))
+        finally:
+            server.terminate()
+        report(args, driver, wall, summary)
+
+
+if __name__ == "__main__":
+    main()
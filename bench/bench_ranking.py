@@ -0,0 +1,73 @@
+"""
+Микро-бенчмарк rank_tracks_by_similarity: старый поштучный цикл против пакетного rapidfuzz.
+Запуск из корня проекта:  python bench/bench_ranking.py
+"""
+import os
+import random
+import string
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rapidfuzz import fuzz
+
+from app.database.requests import rank_tracks_by_similarity
+
+
+def rank_tracks_loop(query: str, tracks: list):
+    """Прежняя реализация — для сравнения скорости и порядка."""
+    ranked = []
+    for track in tracks:
+        title = track.get("title", "").lower()
+        artist = track.get("artist", "").lower()
+        q = query.lower()
+
+        score_title = fuzz.partial_ratio(q, title)
+        score_artist = fuzz.partial_ratio(q, artist)
+        ranked.append((max(score_title, score_artist), track))
+
+    ranked.sort(key=lambda x: x[0], reverse=True)
+    return [t for _, t in ranked]
+
+
+def _word(rng):
+    return "".join(rng.choice(string.ascii_lowercase + "абвгдеклмнопрст") for _ in range(rng.randint(3, 9)))
+
+
+def make_tracks(n, seed=0):
+    rng = random.Random(seed)
+    artists = [" ".join(_word(rng) for _ in range(rng.randint(1, 3))).title() for _ in range(max(1, n // 10))]
+    return [
+        {
+            "title": " ".join(_word(rng) for _ in range(rng.randint(1, 5))).title(),
+            "artist": rng.choice(artists),
+            "duration": f"{rng.randint(1, 6)}:{rng.randint(0, 59):02d}",
+            "url": f"https://example.com/{i}",
+            "thumb": None,
+            "source": rng.choice(["SoundCloud", "SkySound"]),
+        }
+        for i in range(n)
+    ]
+
+
+def main():
+    for n in (30, 130, 500):
+        tracks = make_tracks(n)
+        query = f"{tracks[0]['artist']} {tracks[0]['title'].split()[0]}"
+
+        assert rank_tracks_loop(query, tracks) == rank_tracks_by_similarity(query, tracks), "порядок разошёлся"
+
+        number = 2000 if n <= 130 else 400
+        old = timeit.timeit(lambda: rank_tracks_loop(query, tracks), number=number) / number
+        new = timeit.timeit(lambda: rank_tracks_by_similarity(query, tracks), number=number) / number
+        top = timeit.timeit(lambda: rank_tracks_by_similarity(query, tracks, top_k=18), number=number) / number
+
+        print(
+            f"{n:>4} треков: цикл {old * 1e6:8.1f} мкс | пачкой {new * 1e6:8.1f} мкс "
+            f"(x{old / new:.2f}) | top_k=18 {top * 1e6:8.1f} мкс (x{old / top:.2f})"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Бенчмарк разбора страницы артиста SkySound: BeautifulSoup (html.parser) против lxml.
+Проверяет, что оба бэкенда дают одинаковый результат на сохранённых страницах bench/fixtures.
+Запуск из корня проекта:  python bench/bench_skysound_parser.py
+"""
+import glob
+import os
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.parsers import parse_skysound_bs4, parse_skysound_lxml
+
+FIXTURES = os.path.join(ROOT, "bench", "fixtures", "skysound_*.html")
+
+
+def heavy_page(html, times=8):
+    """Большая страница: список треков повторён times раз."""
+    head, rest = html.split('<div class="playlist">', 1)
+    items, tail = rest.split("    </div>\n  </main>", 1)
+    return head + '<div class="playlist">' + items * times + "    </div>\n  </main>" + tail
+
+
+def main():
+    pages = []
+    for path in sorted(glob.glob(FIXTURES)):
+        with open(path, encoding="utf-8") as f:
+            html = f.read()
+        name = os.path.basename(path)
+        pages.append((name, html))
+        pages.append((f"{name} x8", heavy_page(html)))
+
+    for name, html in pages:
+        expected = parse_skysound_bs4(html, "kino")
+        assert parse_skysound_lxml(html, "kino") == expected, f"{name}: результаты разошлись"
+
+        number = 20
+        bs4_time = timeit.timeit(lambda: parse_skysound_bs4(html, "kino"), number=number) / number
+        lxml_time = timeit.timeit(lambda: parse_skysound_lxml(html, "kino"), number=number) / number
+
+        print(
+            f"{name:<28} {len(html) / 1024:7.0f} КБ, {len(expected):4} треков: "
+            f"bs4 {bs4_time * 1000:7.1f} мс | lxml {lxml_time * 1000:6.1f} мс (x{bs4_time / lxml_time:.1f})"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+Локальные заглушки внешних сервисов для bench/bench_e2e.py:
+- SoundCloud:  /sc/search/tracks, /sc/transcodings/{id}
+- SkySound:    /sky/{artist}/ (div.playlist-item), /sky/{artist}/track/{id} (file: "...mp3")
+- mp3 и обложки: /mp3/{name}.mp3 (HEAD и Range поддерживаются), /img/{id}.jpg
+- Telegram Bot API: /bot{token}/{method}
+- служебное: /bench/inline/{query_id} — что бот ответил на inline-запрос, /bench/stats
+
+Задержка ответа (latency, сек), размер mp3 (mp3_size) и скорость отдачи mp3 на одно
+соединение (mp3_rate, байт/с; None — без ограничения) задаются при запуске.
+Запускается в отдельном процессе, чтобы не делить с ботом event loop и память.
+"""
+import asyncio
+import itertools
+import json
+import re
+import time
+from collections import Counter
+
+from aiohttp import web
+
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)")
+
+
+def _mp3_payload(size):
+    header = b"ID3\x04\x00\x00\x00\x00\x00\x00"
+    frame = b"\xff\xfb\x90\x64" + bytes(412)
+    return (header + frame * (size // len(frame) + 1))[:size]
+
+
+def _jpeg_payload(side=300):
+    # SOI, APP0 (JFIF), SOF0 с размером 300x300 — без Pillow бот проверяет размер по нему
+    app0 = b"\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00"
+    sof = b"\xff\xc0\x00\x11\x08" + side.to_bytes(2, "big") * 2 + b"\x03" + bytes(9)
+    return b"\xff\xd8" + app0 + sof + bytes(4000) + b"\xff\xd9"
+
+
+class StandIns:
+    def __init__(self, latency=0.05, mp3_size=4_000_000, tracks=30, chunk=64 * 1024, mp3_rate=None):
+        self.latency = latency
+        self.mp3_rate = mp3_rate
+        self.tracks = tracks
+        self.chunk = chunk
+        self.mp3 = _mp3_payload(mp3_size)
+        self.jpeg = _jpeg_payload()
+        self.inline_answers = {}
+        self.hits = Counter()
+        self.message_ids = itertools.count(1)
+        self.base = None
+
+    def app(self):
+        app = web.Application(client_max_size=100 * 1024 * 1024)
+        app.router.add_get("/sc/search/tracks", self.sc_search)
+        app.router.add_get("/sc/transcodings/{id}", self.sc_transcoding)
+        app.router.add_get("/sky/{artist}/", self.sky_artist)
+        app.router.add_get("/sky/{artist}/track/{id}", self.sky_track)
+        app.router.add_route("*", "/mp3/{name}", self.mp3_file)
+        app.router.add_get("/img/{id}", self.image)
+        app.router.add_post("/bot{token}/{method}", self.telegram)
+        app.router.add_get("/bench/inline/{query_id}", self.bench_inline)
+        app.router.add_get("/bench/stats", self.bench_stats)
+        return app
+
+    async def _delay(self, name):
+        self.hits[name] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    # --- SoundCloud ---
+
+    async def sc_search(self, request):
+        await self._delay("sc_search")
+        query = request.query.get("q", "")
+        collection = []
+        for i in range(self.tracks):
+            track_id = f"{abs(hash(query)) % 10_000}-{i}"
+            collection.append({
+                "title": f"{query} song {i}",
+                "user": {"username": f"{query} band"},
+                "duration": 180_000 + i * 1000,
+                "artwork_url": f"{self.base}/img/sc-{track_id}-large.jpg",
+                "media": {"transcodings": [{
+                    "preset": "mp3_1",
+                    "url": f"{self.base}/sc/transcodings/{track_id}",
+                    "format": {"protocol": "progressive"},
+                }]},
+            })
+        return web.json_response({"collection": collection})
+
+    async def sc_transcoding(self, request):
+        await self._delay("sc_transcoding")
+        track_id = request.match_info["id"]
+        return web.json_response({"url": f"{self.base}/mp3/sc-{track_id}.mp3"})
+
+    # --- SkySound ---
+
+    async def sky_artist(self, request):
+        await self._delay("sky_artist")
+        artist = request.match_info["artist"]
+        name = artist.replace("-", " ")
+        items = []
+        for i in range(self.tracks):
+            items.append(
+                f'<div class="playlist-item">'
+                f'<div class="playlist-left"><img src="{self.base}/img/sky-{i}.jpg"></div>'
+                f'<a class="playlist-name" title="{name} - track {i} скачать" '
+                f'href="/sky/{artist}/track/{i}">{name} - track {i}</a>'
+                f'<div class="playlist-right"><span class="playlist-duration">3:{i % 60:02d}</span></div>'
+                f'</div>'
+            )
+        html = f'<html><body><div class="playlist">{"".join(items)}</div></body></html>'
+        return web.Response(text=html, content_type="text/html")
+
+    async def sky_track(self, request):
+        await self._delay("sky_track")
+        artist, track_id = request.match_info["artist"], request.match_info["id"]
+        html = f'<html><script>player({{file: "/mp3/sky-{artist}-{track_id}.mp3"}})</script></html>'
+        return web.Response(text=html, content_type="text/html")
+
+    # --- Файлы ---
+
+    async def mp3_file(self, request):
+        await self._delay("mp3_" + request.method.lower())
+        data = self.mp3
+        start, end, status = 0, len(data) - 1, 200
+
+        match = _RANGE.fullmatch(request.headers.get("Range", ""))
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2) or end), end)
+            else:
+                start = max(0, len(data) - int(match.group(2)))
+            status = 206
+
+        headers = {
+            "Content-Type": "audio/mpeg",
+            "Accept-Ranges": "bytes",
+            "Content-Length": str(end - start + 1),
+        }
+        if status == 206:
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+
+        resp = web.StreamResponse(status=status, headers=headers)
+        await resp.prepare(request)
+        if request.method != "HEAD":
+            for offset in range(start, end + 1, self.chunk):
+                await resp.write(data[offset:min(offset + self.chunk, end + 1)])
+                if self.mp3_rate:
+                    # медленный узел CDN: скорость ограничена на соединение, а не на сервер
+                    await asyncio.sleep(self.chunk / self.mp3_rate)
+        await resp.write_eof()
+        return resp
+
+    async def image(self, request):
+        await self._delay("image")
+        return web.Response(body=self.jpeg, content_type="image/jpeg")
+
+    # --- Telegram ---
+
+    def _message(self, chat_id, **extra):
+        return {
+            "message_id": next(self.message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id or 1), "type": "private"},
+            **extra,
+        }
+
+    async def telegram(self, request):
+        method = request.match_info["method"].lower()
+        await self._delay("tg_" + method)
+        form = await request.post()   # заодно вычитывает загружаемый файл целиком
+
+        if method == "answerinlinequery":
+            self.inline_answers[form["inline_query_id"]] = json.loads(form["results"])
+            result = True
+        elif method == "sendaudio":
+            message_id = next(self.message_ids)
+            result = self._message(form.get("chat_id"), audio={
+                "file_id": f"audio-{message_id}",
+                "file_unique_id": f"u{message_id}",
+                "duration": 180,
+            })
+        elif method in ("sendmessage", "sendsticker", "editmessagetext", "editmessagemedia"):
+            result = True if form.get("inline_message_id") else self._message(form.get("chat_id"))
+        else:
+            result = True
+
+        return web.json_response({"ok": True, "result": result})
+
+    # --- Служебное ---
+
+    async def bench_inline(self, request):
+        return web.json_response(self.inline_answers.get(request.match_info["query_id"], []))
+
+    async def bench_stats(self, request):
+        return web.json_response(dict(self.hits))
+
+
+def serve(conn, **options):
+    """Точка входа дочернего процесса: поднимает сервер и пишет порт в conn."""
+    async def main():
+        standins = StandIns(**options)
+        runner = web.AppRunner(standins.app(), access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        standins.base = f"http://127.0.0.1:{port}"
+        conn.send(port)
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
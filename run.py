@@ -4,6 +4,15 @@ from aiogram import Dispatcher
 from app.user import user
 from app.admin import admin
 from app.inline import router
+from app.http import init_http, close_http
+from app.download import cleanup_spool
+from app.scheduler import downloads
+from app.database.batcher import writes
+from app.logs import setup_logging, stop_logging
+from app import audio_cache, metrics
+from app.settings import BOT_MODE, UPDATES_CONCURRENCY
+from app.webhook import run_webhook
+from app.ratelimit import TelegramRateLimit
 
 from config import bot
 
@@ -15,17 +24,40 @@ from app.database.models import async_main
 
 async def main():
     dp = Dispatcher(allow_bot_messages=True)
-    dp.include_routers(user, router, admin)
+    # admin первым: иначе /stats перехватит общий обработчик текста в user
+    dp.include_routers(admin, user, router)
     dp.startup.register(startup)
+    dp.shutdown.register(shutdown)
+    bot.session.middleware(TelegramRateLimit())
 
-    await dp.start_polling(bot)
+    if BOT_MODE == "webhook":
+        await run_webhook(dp, bot)
+    else:
+        # вебхук от прошлого запуска в режиме webhook остаётся у Telegram — с ним getUpdates
+        # не работает; накопившиеся апдейты не сбрасываем
+        await bot.delete_webhook(drop_pending_updates=False)
+        await dp.start_polling(bot, tasks_concurrency_limit=UPDATES_CONCURRENCY)
 
 async def startup(dispatcher: Dispatcher):
     await async_main()
+    await init_http()
+    cleanup_spool()
+    await audio_cache.cleanup()
+    await metrics.start_server()
+
+
+async def shutdown(dispatcher: Dispatcher):
+    await downloads.stop()
+    await writes.stop()
+    await metrics.stop_server()
+    await close_http()
 
 
 if __name__ == '__main__':
+    setup_logging()
     try:
         asyncio.run(main())
     except:
-        print('Exit')
\ No newline at end of file
+        print('Exit')
+    finally:
+        stop_logging()
@@ -0,0 +1,19 @@
+"""
+config.py с токеном в репозиторий не входит — для тестов подставляем пустой модуль,
+настройки app/settings.py берут значения по умолчанию.
+"""
+import os
+import sys
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if "config" not in sys.modules:
+    try:
+        import config  # noqa: F401
+    except ImportError:
+        config = types.ModuleType("config")
+        config.bot = None
+        config.SOUNDCLOUD_CLIENT_ID = "test"
+        config.proxy_url = None
+        sys.modules["config"] = config
@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+from app import breaker
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers():
+    breaker._breakers.clear()
+    breaker._latency.clear()
+    yield
+    breaker._breakers.clear()
+    breaker._latency.clear()
+
+
+def _open(name):
+    cb = breaker.breaker(name)
+    cb.state = cb.OPEN
+    cb.opened_at = 0.0   # пауза давно прошла — следующий вызов станет пробным
+    return cb
+
+
+async def _ok():
+    return "ok"
+
+
+async def _hang():
+    await asyncio.Event().wait()
+
+
+def test_cancelled_probe_lets_next_probe_through():
+    cb = _open("test")
+
+    async def scenario():
+        probe = asyncio.create_task(breaker.guarded("test", _hang))
+        await asyncio.sleep(0)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        assert not cb.probing
+        return await breaker.guarded("test", _ok)
+
+    assert asyncio.run(scenario()) == "ok"
+    assert cb.state == cb.CLOSED
+
+
+def test_only_one_probe_while_half_open():
+    _open("test")
+
+    async def scenario():
+        probe = asyncio.create_task(breaker.guarded("test", _hang))
+        await asyncio.sleep(0)
+        try:
+            with pytest.raises(breaker.ProviderUnavailable):
+                await breaker.guarded("test", _ok)
+        finally:
+            probe.cancel()
+            await asyncio.gather(probe, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+
+def test_local_errors_do_not_open_breaker():
+    cb = breaker.breaker("test")
+
+    async def broken():
+        raise UnicodeError("label empty or too long")
+
+    async def scenario():
+        for _ in range(cb.max_failures + 1):
+            with pytest.raises(UnicodeError):
+                await breaker.guarded("test", broken)
+        return await breaker.guarded("test", _ok)
+
+    assert asyncio.run(scenario()) == "ok"
+    assert cb.state == cb.CLOSED and cb.failures == 0
+
+
+def test_upstream_errors_open_breaker():
+    cb = breaker.breaker("test")
+
+    async def failing():
+        raise breaker.UpstreamError("HTTP 503")
+
+    async def scenario():
+        for _ in range(cb.max_failures):
+            with pytest.raises(breaker.UpstreamError):
+                await breaker.guarded("test", failing)
+        with pytest.raises(breaker.ProviderUnavailable):
+            await breaker.guarded("test", _ok)
+
+    asyncio.run(scenario())
+
+
+def test_failed_local_probe_releases_half_open_slot():
+    cb = _open("test")
+
+    async def broken():
+        raise ValueError("bad request")
+
+    async def scenario():
+        with pytest.raises(ValueError):
+            await breaker.guarded("test", broken)
+        return await breaker.guarded("test", _ok)
+
+    assert asyncio.run(scenario()) == "ok"
+    assert cb.state == cb.CLOSED
+
+
+@pytest.mark.parametrize("query", ["🔥🔥🔥", "!!!", "a" * 70, "очень длинное название песни " * 3])
+def test_skysound_skips_queries_without_valid_subdomain(query, monkeypatch):
+    from app.database import requests
+
+    async def no_network(*args, **kwargs):
+        raise AssertionError("запрос не должен уходить в сеть")
+
+    monkeypatch.setattr(requests, "_fetch", no_network)
+    assert asyncio.run(requests.search_skysound(query)) == []
+    assert breaker.breaker("SkySound").failures == 0
@@ -0,0 +1,58 @@
+from app.dedup import dedup_tracks, fingerprint, normalize_text
+
+
+def _track(source, title, duration="3:00", artist="Artist"):
+    return {"source": source, "url": f"{source}:{title}", "title": title, "artist": artist,
+            "duration": duration}
+
+
+def test_normalize_text_strips_markers_and_transliterates():
+    assert normalize_text("Песня (feat. Кто-то) [Official Audio]") == "pesnya"
+    assert normalize_text("Song ft. Someone") == "song"
+
+
+def test_fingerprint_takes_artist_from_soundcloud_title():
+    track = _track("SoundCloud", "Artist - Song (Radio Edit)", artist="uploader42")
+    assert fingerprint(track) == ("artist", "song")
+
+
+def test_same_track_from_different_sources_is_merged():
+    sky = _track("SkySound", "Song", "3:01")
+    sc = _track("SoundCloud", "Artist - Song", "3:00", artist="uploader")
+
+    result = dedup_tracks([sc, sky])
+
+    assert len(result) == 1
+    assert [t["source"] for t in [result[0], *result[0]["alternates"]]] == ["SkySound", "SoundCloud"]
+
+
+def test_versions_from_one_source_stay_separate():
+    tracks = [
+        _track("SoundCloud", "Song", "3:00"),
+        _track("SoundCloud", "Song (Live)", "3:03"),
+        _track("SoundCloud", "Artist - Song (Club Remix)", "3:02"),
+    ]
+
+    result = dedup_tracks(tracks)
+
+    assert [t["title"] for t in result] == [t["title"] for t in tracks]
+    assert all("alternates" not in t for t in result)
+
+
+def test_cluster_holds_at_most_one_track_per_source():
+    tracks = [
+        _track("SoundCloud", "Song", "3:00"),
+        _track("SoundCloud", "Song (Live)", "3:01"),
+        _track("SkySound", "Song", "3:00"),
+    ]
+
+    result = dedup_tracks(tracks)
+
+    assert len(result) == 2
+    merged = next(t for t in result if "alternates" in t)
+    assert {t["source"] for t in [merged, *merged["alternates"]]} == {"SoundCloud", "SkySound"}
+
+
+def test_different_durations_are_not_merged():
+    result = dedup_tracks([_track("SoundCloud", "Song", "3:00"), _track("SkySound", "Song", "5:00")])
+    assert len(result) == 2
@@ -0,0 +1,52 @@
+import asyncio
+
+from app.scheduler import DownloadScheduler
+
+
+def test_follower_runs_own_job_when_leader_fails():
+    async def scenario():
+        scheduler = DownloadScheduler(workers={}, default_workers=1)
+        calls = []
+
+        async def leader():
+            calls.append("leader")
+            await asyncio.sleep(0.01)
+            raise RuntimeError("Forbidden: bot can't initiate conversation")
+
+        async def follower():
+            calls.append("follower")
+            return "file_id"
+
+        job = scheduler.submit("key", "Source", leader)
+        assert scheduler.submit("key", "Source", follower) is job
+
+        results = await asyncio.gather(
+            scheduler.wait(job, leader), scheduler.wait(job, follower), return_exceptions=True
+        )
+        await scheduler.stop()
+        return results, calls
+
+    (leader_result, follower_result), calls = asyncio.run(scenario())
+    assert isinstance(leader_result, RuntimeError)
+    assert follower_result == "file_id"
+    assert calls == ["leader", "follower"]
+
+
+def test_follower_shares_leader_result():
+    async def scenario():
+        scheduler = DownloadScheduler(workers={}, default_workers=1)
+
+        async def leader():
+            await asyncio.sleep(0.01)
+            return "file_id"
+
+        async def follower():
+            raise AssertionError("не должен запускаться")
+
+        job = scheduler.submit("key", "Source", leader)
+        scheduler.submit("key", "Source", follower)
+        results = await asyncio.gather(scheduler.wait(job, leader), scheduler.wait(job, follower))
+        await scheduler.stop()
+        return results
+
+    assert asyncio.run(scenario()) == ["file_id", "file_id"]